@@ -18,6 +18,10 @@ MARIO_VISUALISATION_CLASS = "mario.VisualizationTool"
 
 # GAME 2048 STUFF
 GAME2048_PY_PATH = prefix + "general-ai/Game-interfaces/Game2048/game_2048.py"
+GAME2048_BITBOARD_PY_PATH = prefix + "general-ai/Game-interfaces/Game2048/game_2048_bitboard.py"
+GAME2048_BATCH_PY_PATH = prefix + "general-ai/Game-interfaces/Game2048/game_2048_batch.py"
+GAME2048_ENCODERS_PY_PATH = prefix + "general-ai/Game-interfaces/Game2048/state_encoders.py"
+GAME2048_TRAJECTORIES_PY_PATH = prefix + "general-ai/Game-interfaces/Game2048/trajectories.py"
 
 # ALHAMBRA STUFF
 ALHAMBRA = prefix + "general-ai/Game-interfaces/Alhambra/AlhambraInterface/AlhambraInterface/bin/Release/AlhambraInterface.exe"
@@ -34,3 +38,17 @@ GAME2048_CONFIG_FILE = prefix + "general-ai/Game-interfaces/Game2048/2048_config
 ALHAMBRA_CONFIG_FILE = prefix + "general-ai/Game-interfaces/Alhambra/Alhambra_config.json"
 TORCS_CONFIG_FILE = prefix + "general-ai/Game-interfaces/TORCS/TORCS_config.json"
 MARIO_CONFIG_FILE = prefix + "general-ai/Game-interfaces/Mario/Mario_config.json"
+
+# ECHO STATE STUFF
+# Reservoirs of Echo-State models stored on disk (memory-mapped by all processes), None to disable
+ESN_RESERVOIR_CACHE_DIR = os.path.join(os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache")),
+                                       "general-ai", "reservoirs")
+# Maximum total size of reservoirs on disk in bytes (least recently used reservoirs are removed), None for no limit
+ESN_RESERVOIR_CACHE_SIZE = 2 * 1024 ** 3
+
+# DISTRIBUTED EVALUATION STUFF
+# Address where the coordinator listens for workers (only this host by default)
+DISTRIBUTED_ADDRESS = ("127.0.0.1", 6000)
+# Key shared by the coordinator and workers, required for workers on other hosts. If it is not set, the coordinator
+# accepts only local workers and generates a random key for them.
+DISTRIBUTED_AUTHKEY = os.environ["GENERAL_AI_AUTHKEY"].encode() if "GENERAL_AI_AUTHKEY" in os.environ else None
@@ -10,8 +10,8 @@ class DifferentialEvolution(Evolution):
     Provides a differential evolution functions.
     """
 
-    def __init__(self, game, evolution_params, model, max_workers, logs_every=50):
-        super(DifferentialEvolution, self).__init__(game, evolution_params, model, max_workers, logs_every)
+    def __init__(self, game, evolution_params, model, max_workers, logs_every=50, backend="threads"):
+        super(DifferentialEvolution, self).__init__(game, evolution_params, model, max_workers, logs_every, backend)
 
     def deap_toolbox_init(self):
         """
@@ -41,74 +41,89 @@ class DifferentialEvolution(Evolution):
         Starts differential evolution.
         :param file_name: Previously saved population file.
         """
-        start_time = time.time()
-
-        logs_dir = self.init_directories()
-
-        stats = tools.Statistics(lambda ind: ind.fitness.values)
-        stats.register("avg", np.mean)
-        stats.register("min", np.min)
-        stats.register("max", np.max)
-
-        toolbox = self.deap_toolbox_init()
-        population = toolbox.population(pop_size=self.evolution_params.pop_size, file_name=file_name)
-
-        logbook = tools.Logbook()
-        logbook.header = ['gen', 'nevals'] + (stats.fields if stats else [])
-
-        if (self.evolution_params.hof_size > 0):
-            halloffame = tools.HallOfFame(self.evolution_params.hof_size)
-        else:
-            halloffame = None
-
-        # invalid_ind = [ind for ind in population if not ind.fitness.valid]
-        invalid_ind = population
-        seeds = [np.random.randint(0, 2 ** 16) for _ in range(len(invalid_ind))]
-        fitnesses = toolbox.map(toolbox.evaluate, invalid_ind, seeds)
-        for ind, fit in zip(invalid_ind, fitnesses):
-            ind.fitness.values = fit
-
-        if halloffame is not None:
-            halloffame.update(population)
-
-        record = stats.compile(population) if stats else {}
-        logbook.record(gen=0, nevals=str(len(invalid_ind)), **record)
-
-        print(logbook.stream)
-        population.sort(key=lambda ind: ind.fitness.values, reverse=True)
-
-        # Begin the generational process with differential evolution
-        for gen in range(1, self.evolution_params.ngen + 1):
-            for k, agent in enumerate(population):
-                a, b, c = toolbox.select(population)
-                y = toolbox.clone(agent)
-                index = np.random.randint(self.individual_len)
-                for i, value in enumerate(agent):
-                    if i == index or np.random.random() < self.evolution_params.cr:
-                        y[i] = a[i] + self.evolution_params.f * (b[i] - c[i])
-                seed = np.random.randint(0, 2 ** 16)
-                y.fitness.values = toolbox.evaluate(y, seed)
-                if y.fitness > agent.fitness:
-                    population[k] = y
-
-            """
-            # In case we want evaluate fitness of all individuals (and not only new modified)
-            seeds = [np.random.randint(0, 2 ** 16) for _ in range(len(population))]
-            fitnesses = toolbox.map(toolbox.evaluate, population, seeds)
-            for ind, fit in zip(population, fitnesses):
+        try:
+            start_time = time.time()
+
+            logs_dir = self.init_directories()
+
+            stats = tools.Statistics(lambda ind: ind.fitness.values)
+            stats.register("avg", np.mean)
+            stats.register("min", np.min)
+            stats.register("max", np.max)
+
+            toolbox = self.deap_toolbox_init()
+            population = toolbox.population(pop_size=self.evolution_params.pop_size, file_name=file_name)
+
+            logbook = tools.Logbook()
+            logbook.header = ['gen', 'nevals'] + (stats.fields if stats else [])
+
+            if (self.evolution_params.hof_size > 0):
+                halloffame = tools.HallOfFame(self.evolution_params.hof_size)
+            else:
+                halloffame = None
+
+            # invalid_ind = [ind for ind in population if not ind.fitness.valid]
+            invalid_ind = population
+            seeds = [np.random.randint(0, 2 ** 16) for _ in range(len(invalid_ind))]
+            fitnesses = self.evaluate_population(toolbox, invalid_ind, seeds)
+            for ind, fit in zip(invalid_ind, fitnesses):
                 ind.fitness.values = fit
-            """
+
             if halloffame is not None:
                 halloffame.update(population)
 
-            population.sort(key=lambda ind: ind.fitness.values, reverse=True)
-
-            # Append the current generation statistics to the logbook
             record = stats.compile(population) if stats else {}
-            logbook.record(gen=gen, nevals=str(len(invalid_ind)), **record)
+            logbook.record(gen=0, nevals=str(len(invalid_ind)), **record)
 
             print(logbook.stream)
-            if (gen % self.logs_every == 0):
-                self.log_all(logs_dir, population, halloffame, logbook, start_time)
+            self.print_startup_time()
+            population.sort(key=lambda ind: ind.fitness.values, reverse=True)
 
-        self.log_all(logs_dir, population, halloffame, logbook, start_time)
+            # Begin the generational process with differential evolution
+            for gen in range(1, self.evolution_params.ngen + 1):
+                # Trial vectors of all agents are built from the current population and evaluated at once (by the
+                # backend), then every agent is replaced by its trial vector if it is better
+                trials = []
+                for agent in population:
+                    a, b, c = toolbox.select(population)
+                    y = toolbox.clone(agent)
+                    index = np.random.randint(self.individual_len)
+                    for i, value in enumerate(agent):
+                        if i == index or np.random.random() < self.evolution_params.cr:
+                            y[i] = a[i] + self.evolution_params.f * (b[i] - c[i])
+                    trials.append(y)
+
+                invalid_ind = trials
+                seeds = [np.random.randint(0, 2 ** 16) for _ in range(len(invalid_ind))]
+                fitnesses = self.evaluate_population(toolbox, invalid_ind, seeds)
+                for ind, fit in zip(invalid_ind, fitnesses):
+                    ind.fitness.values = fit
+
+                for k, y in enumerate(trials):
+                    if y.fitness > population[k].fitness:
+                        population[k] = y
+
+                """
+                # In case we want evaluate fitness of all individuals (and not only new modified)
+                seeds = [np.random.randint(0, 2 ** 16) for _ in range(len(population))]
+                fitnesses = self.evaluate_population(toolbox, population, seeds)
+                for ind, fit in zip(population, fitnesses):
+                    ind.fitness.values = fit
+                """
+                if halloffame is not None:
+                    halloffame.update(population)
+
+                population.sort(key=lambda ind: ind.fitness.values, reverse=True)
+
+                # Append the current generation statistics to the logbook
+                record = stats.compile(population) if stats else {}
+                logbook.record(gen=gen, nevals=str(len(invalid_ind)), **record)
+
+                print(logbook.stream)
+                self.print_startup_time()
+                if (gen % self.logs_every == 0):
+                    self.log_all(logs_dir, population, halloffame, logbook, start_time)
+
+            self.log_all(logs_dir, population, halloffame, logbook, start_time)
+        finally:
+            self.close()
@@ -0,0 +1,441 @@
+"""
+Distributed evaluation of fitness. A coordinator (in the process of the evolution) hands out jobs (individual id, seed,
+game) to worker processes on the same or other hosts over TCP and collects their fitness. Connections are
+authenticated by a shared key (see 'multiprocessing.connection'); weights of individuals are sent as raw bytes.
+
+Messages are pickled, so anybody who knows the key can run code on the coordinator (as a worker) or on workers (as a
+coordinator). By default, the coordinator listens only on this host and uses a random key known only to its local
+workers; workers on other hosts require listening on another address and a key shared in GENERAL_AI_AUTHKEY
+environment variable (see constants). Use them only on trusted networks.
+
+Workers send heartbeats, a worker that is silent for 'heartbeat_timeout' is considered dead and its job is handed out
+again. Failed jobs are retried ('max_retries' times), and jobs running much longer than others (stragglers) are
+dispatched again to idle workers; the first result is used.
+
+Start a worker (from the Controller directory, with GENERAL_AI_AUTHKEY set): python -m evolution.distributed HOST PORT
+"""
+import ipaddress
+import os
+import sys
+import threading
+import time
+import traceback
+import multiprocessing
+from collections import deque
+from multiprocessing.connection import Listener, Client
+
+import numpy as np
+
+import constants
+from utils.miscellaneous import get_game_config, get_game_instance
+
+
+class Job():
+    """
+    Evaluation of a single individual.
+    """
+
+    def __init__(self, job_id, individual_id, seed, game, weights):
+        """
+        Initializes a new instance of Job.
+        :param job_id: Unique id of the job.
+        :param individual_id: Index of the individual in the evaluated batch.
+        :param seed: Seed for the game instance.
+        :param game: Game name.
+        :param weights: Weights of the individual (bytes of float64 array).
+        """
+        self.job_id = job_id
+        self.individual_id = individual_id
+        self.seed = seed
+        self.game = game
+        self.weights = weights
+        self.attempts = 0
+        self.workers = set()  # workers running the job
+        self.started = None  # time of the first dispatch of the current attempt
+        self.result = None
+
+    @property
+    def done(self):
+        return self.result is not None
+
+
+class DistributedEvaluator():
+    """
+    Coordinator of distributed evaluation of fitness (started on the first use).
+    """
+
+    def __init__(self, game, model, game_batch_size, address=constants.DISTRIBUTED_ADDRESS,
+                 authkey=constants.DISTRIBUTED_AUTHKEY, local_workers=0, heartbeat_timeout=30, max_retries=3,
+                 straggler_factor=3.0, startup_timeout=60):
+        """
+        Initializes a new instance of DistributedEvaluator.
+        :param game: Game name.
+        :param model: Model (without weights) used to create instances of individuals, sent to every worker once.
+        :param game_batch_size: Number of games played by every individual.
+        :param address: Address (host, port) where the coordinator listens for workers.
+        :param authkey: Key shared by the coordinator and workers (bytes), or None to generate a random key for local
+        workers (allowed only if the coordinator listens on a loopback address).
+        :param local_workers: Number of worker processes started on this host.
+        :param heartbeat_timeout: Seconds without a message after which a worker is considered dead (workers send
+        heartbeats three times more often).
+        :param max_retries: Number of retries of a job after its worker has failed or died.
+        :param straggler_factor: A job is dispatched again to an idle worker if it runs 'straggler_factor' times
+        longer than the median job of the batch.
+        :param startup_timeout: Evaluation fails if no worker is connected for this number of seconds (counted from
+        the last start of local workers, which takes several seconds).
+        """
+        self.game = game
+        self.model = model
+        self.game_batch_size = game_batch_size
+        self.address = address
+        self.authkey = authkey
+        self.local_workers = local_workers
+        self.heartbeat_timeout = heartbeat_timeout
+        self.max_retries = max_retries
+        self.straggler_factor = straggler_factor
+        self.startup_timeout = startup_timeout
+
+        self.listener = None
+        self.processes = []
+        self.workers_started = None  # time of the last start of local workers
+        self.workers = set()  # ids of connected workers
+        self.closing = False
+        self.condition = threading.Condition()
+        self.next_job_id = 0
+        self.jobs = {}
+        self.pending = deque()
+        self.durations = []
+        self.remaining = 0
+        self.error = None
+
+    @property
+    def connect_address(self):
+        """
+        Address for workers on this host.
+        """
+        host, port = self.address
+        return ("localhost" if host in ("", "0.0.0.0") else host), port
+
+    def start(self):
+        """
+        Starts listening for workers and starts local workers (if not running yet).
+        """
+        if self.listener is not None:
+            return
+        if self.authkey is None:
+            if not is_loopback(self.address[0]):
+                raise ValueError("Workers on other hosts need a shared key (GENERAL_AI_AUTHKEY environment variable)")
+            self.authkey = os.urandom(32)
+        self.listener = Listener(self.address, authkey=self.authkey)
+        self.address = self.listener.address  # actual port if the port was 0
+        threading.Thread(target=self.accept_workers, daemon=True).start()
+        print("Coordinator listening on {}:{}".format(*self.address))
+        self.processes = start_local_workers(self.local_workers, self.connect_address, self.authkey)
+        self.workers_started = time.time()
+
+    def accept_workers(self):
+        """
+        Accepts connections of workers, every worker is served by its own thread.
+        """
+        worker_id = 0
+        while not self.closing:
+            try:
+                connection = self.listener.accept()
+            except (OSError, EOFError, multiprocessing.AuthenticationError):
+                if self.closing:
+                    return
+                continue
+            if self.closing:
+                connection.close()
+                return
+            worker_id += 1
+            threading.Thread(target=self.serve_worker, args=(connection, worker_id), daemon=True).start()
+
+    def serve_worker(self, connection, worker_id):
+        """
+        Sends jobs to a single worker and receives its results until the coordinator is closed or the worker dies.
+        :param connection: Connection to the worker.
+        :param worker_id: Id of the worker.
+        """
+        job = None
+        try:
+            connection.send(("setup", self.game, self.model, self.game_batch_size, self.heartbeat_timeout / 3))
+            if not self.receive(connection, "ready"):
+                return
+            print("Worker {} connected".format(worker_id))
+            with self.condition:
+                self.workers.add(worker_id)
+            while True:
+                job = self.next_job(worker_id)
+                if job is None:
+                    connection.send(("stop",))
+                    return
+                connection.send(("job", job.job_id, job.individual_id, job.seed, job.game))
+                connection.send_bytes(job.weights)
+                message = self.receive(connection, "result", "error")
+                if message is None:
+                    self.fail_job(job, worker_id, "worker {} died".format(worker_id))
+                    return
+                if message[0] == "result":
+                    self.finish_job(job, worker_id, message[2])
+                else:
+                    self.fail_job(job, worker_id, message[2])
+                job = None
+        except (OSError, EOFError):
+            if job is not None:
+                self.fail_job(job, worker_id, "worker {} disconnected".format(worker_id))
+        finally:
+            with self.condition:
+                self.workers.discard(worker_id)
+                self.condition.notify_all()
+            connection.close()
+
+    def restart_local_workers(self):
+        """
+        Starts new local workers instead of those that have died (must be called with the condition locked).
+        """
+        for i, process in enumerate(self.processes):
+            if not process.is_alive():
+                print("Local worker {} has exited (code {}), restarting".format(process.pid, process.exitcode))
+                process.join()
+                self.processes[i], = start_local_workers(1, self.connect_address, self.authkey)
+                self.workers_started = time.time()
+
+    def receive(self, connection, *kinds):
+        """
+        Receives the next message of the specified kinds from a worker, skipping heartbeats.
+        :param connection: Connection to the worker.
+        :param kinds: Kinds of expected messages.
+        :return: The message, or None if the worker was silent for 'heartbeat_timeout'.
+        """
+        while connection.poll(self.heartbeat_timeout):
+            message = connection.recv()
+            if message[0] in kinds:
+                return message
+        return None
+
+    def next_job(self, worker_id):
+        """
+        Waits for a job for the specified worker: a pending job or a straggler of other workers.
+        :param worker_id: Id of the worker.
+        :return: The job, or None if the coordinator is closed.
+        """
+        with self.condition:
+            while not self.closing:
+                while self.pending:
+                    job = self.pending.popleft()
+                    if not job.done and job.job_id in self.jobs:
+                        job.workers.add(worker_id)
+                        job.started = time.time()
+                        return job
+                job = self.find_straggler(worker_id)
+                if job is not None:
+                    job.workers.add(worker_id)
+                    return job
+                self.condition.wait(timeout=1.0)
+        return None
+
+    def find_straggler(self, worker_id):
+        """
+        Finds the longest running job that runs 'straggler_factor' times longer than the median job of the batch
+        (must be called with the condition locked).
+        :param worker_id: Id of an idle worker.
+        :return: The job, or None.
+        """
+        if not self.durations:
+            return None
+        limit = self.straggler_factor * np.median(self.durations)
+        now = time.time()
+        stragglers = [job for job in self.jobs.values()
+                      if not job.done and len(job.workers) == 1 and worker_id not in job.workers
+                      and now - job.started > limit]
+        if not stragglers:
+            return None
+        return min(stragglers, key=lambda job: job.started)
+
+    def finish_job(self, job, worker_id, fitness):
+        """
+        Stores the result of a job (only the first result of a job dispatched more times is used).
+        """
+        with self.condition:
+            job.workers.discard(worker_id)
+            if job.done or job.job_id not in self.jobs:
+                return
+            job.result = fitness
+            self.durations.append(time.time() - job.started)
+            self.remaining -= 1
+            self.condition.notify_all()
+
+    def fail_job(self, job, worker_id, error):
+        """
+        Hands out a failed job again, or stops the evaluation if the job has failed too many times.
+        """
+        with self.condition:
+            job.workers.discard(worker_id)
+            if job.done or job.job_id not in self.jobs:
+                return
+            job.attempts += 1
+            print("Job {} (individual {}) failed: {}".format(job.job_id, job.individual_id, error))
+            if job.attempts > self.max_retries:
+                self.error = "Job {} failed {} times, last error: {}".format(job.job_id, job.attempts, error)
+            elif not job.workers:
+                self.pending.appendleft(job)
+            self.condition.notify_all()
+
+    def evaluate(self, individuals, seeds):
+        """
+        Evaluates fitness of all specified individuals.
+        :param individuals: Individuals to evaluate.
+        :param seeds: Seed for the game of every individual.
+        :return: Fitness of every individual (tuples, as required by Deap library).
+        """
+        if len(individuals) == 0:
+            return []
+        self.start()
+        with self.condition:
+            jobs = []
+            for individual_id, (individual, seed) in enumerate(zip(individuals, seeds)):
+                weights = np.asarray(individual, dtype=np.float64).tobytes()
+                jobs.append(Job(self.next_job_id, individual_id, int(seed), self.game, weights))
+                self.next_job_id += 1
+            self.jobs = {job.job_id: job for job in jobs}
+            self.pending.extend(jobs)
+            self.durations = []
+            self.remaining = len(jobs)
+            self.error = None
+            self.condition.notify_all()
+
+            no_workers_since = None
+            while self.remaining > 0 and self.error is None:
+                self.condition.wait(timeout=1.0)
+                self.restart_local_workers()
+                if self.workers:
+                    no_workers_since = None
+                elif no_workers_since is None:
+                    no_workers_since = time.time()
+                elif time.time() - max(no_workers_since, self.workers_started) > self.startup_timeout:
+                    self.error = "No worker connected for {} sec".format(self.startup_timeout)
+            error = self.error
+            self.jobs = {}
+            self.pending.clear()
+        if error is not None:
+            raise RuntimeError(error)
+        return [(job.result,) for job in jobs]
+
+    def close(self):
+        """
+        Stops workers and the coordinator.
+        """
+        if self.listener is None:
+            return
+        with self.condition:
+            self.closing = True
+            self.condition.notify_all()
+        try:
+            Client(self.connect_address, authkey=self.authkey).close()  # wakes up 'accept_workers'
+        except (OSError, EOFError, multiprocessing.AuthenticationError):
+            pass
+        self.listener.close()
+        self.listener = None
+        # Workers get the stop message after their current job, workers stuck in a game are terminated
+        deadline = time.time() + self.heartbeat_timeout
+        for process in self.processes:
+            process.join(timeout=max(deadline - time.time(), 0))
+            if process.is_alive():
+                process.terminate()
+                process.join(timeout=1)
+            if process.is_alive():
+                process.kill()  # suspended processes don't handle SIGTERM
+                process.join()
+        self.processes = []
+
+
+def is_loopback(host):
+    """
+    Returns whether the specified host is a loopback address (only processes of this host can connect to it).
+    :param host: Host name or IP address.
+    :return: True for loopback addresses.
+    """
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False  # host name
+
+
+def run_worker(address, authkey=constants.DISTRIBUTED_AUTHKEY):
+    """
+    Runs a worker: evaluates jobs of the coordinator at the specified address until the coordinator stops it.
+    :param address: Address (host, port) of the coordinator.
+    :param authkey: Key shared by the coordinator and workers (bytes).
+    """
+    connection = Client(address, authkey=authkey)
+    message = connection.recv()
+    if message[0] != "setup":
+        connection.close()
+        return
+    _, game, model, game_batch_size, heartbeat_interval = message
+    game_configs = {game: get_game_config(game)}
+
+    lock = threading.Lock()
+    stopped = threading.Event()
+
+    def send(message):
+        with lock:
+            connection.send(message)
+
+    def heartbeat():
+        while not stopped.wait(heartbeat_interval):
+            try:
+                send(("heartbeat",))
+            except (OSError, EOFError):
+                return
+
+    send(("ready",))
+    threading.Thread(target=heartbeat, daemon=True).start()
+    try:
+        while True:
+            message = connection.recv()
+            if message[0] == "stop":
+                break
+            _, job_id, individual_id, seed, game = message
+            weights = np.frombuffer(connection.recv_bytes(), dtype=np.float64)
+            try:
+                if game not in game_configs:
+                    game_configs[game] = get_game_config(game)
+                instance = model.get_new_instance(weights=weights, game_config=game_configs[game])
+                result = get_game_instance(game, [instance, game_batch_size, seed]).run()
+                send(("result", job_id, result))
+            except Exception:
+                send(("error", job_id, traceback.format_exc()))
+    except (OSError, EOFError):
+        pass  # coordinator has stopped
+    finally:
+        stopped.set()
+        connection.close()
+
+
+def start_local_workers(n, address, authkey):
+    """
+    Starts worker processes on this host.
+    :param n: Number of workers.
+    :param address: Address (host, port) of the coordinator.
+    :param authkey: Key shared by the coordinator and workers (bytes).
+    :return: List of started processes.
+    """
+    context = multiprocessing.get_context("spawn")
+    processes = [context.Process(target=run_worker, args=(address, authkey), daemon=True) for _ in range(n)]
+    for process in processes:
+        process.start()
+    return processes
+
+
+if __name__ == '__main__':
+    # Usage: python -m evolution.distributed HOST PORT (key is taken from GENERAL_AI_AUTHKEY environment variable)
+    if constants.DISTRIBUTED_AUTHKEY is None:
+        sys.exit("Set the key shared with the coordinator in GENERAL_AI_AUTHKEY environment variable")
+    host = sys.argv[1] if len(sys.argv) > 1 else constants.DISTRIBUTED_ADDRESS[0]
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else constants.DISTRIBUTED_ADDRESS[1]
+    print("Worker {} connecting to {}:{}".format(os.getpid(), host, port))
+    run_worker((host, port))
@@ -17,6 +17,8 @@ import utils.miscellaneous
 
 from deap import creator, base, tools
 from utils.miscellaneous import get_game_config, get_game_instance
+from evolution.distributed import DistributedEvaluator
+from evolution.process_pool import ProcessPoolEvaluator
 
 
 class Evolution():
@@ -25,15 +27,37 @@ class Evolution():
     """
     all_time_best = []
 
-    def __init__(self, game, evolution_params, model, max_workers, logs_every=50):
+    def __init__(self, game, evolution_params, model, max_workers, logs_every=50, backend="threads"):
+        """
+        Initializes a new instance of evolution.
+        :param game: Game name.
+        :param evolution_params: Parameters of the evolution.
+        :param model: Model (without weights) of individuals.
+        :param max_workers: Number of workers evaluating fitness of individuals (local workers started with the
+        coordinator if the backend is "distributed").
+        :param logs_every: Number of generations between logs.
+        :param backend: Backend evaluating fitness: "threads" (thread pool of the current process), "processes"
+        (pool of long-lived worker processes, weights of individuals are published in shared memory) or "distributed"
+        (workers on this or other hosts connected over TCP, see 'evolution.distributed').
+        """
         self.current_game = game
         self.evolution_params = evolution_params
         self.model = model
         self.max_workers = max_workers
         self.logs_every = logs_every
+        self.backend = backend
 
         self.game_config = get_game_config(game)
 
+        self.evaluator = None
+        if backend == "processes":
+            self.evaluator = ProcessPoolEvaluator(game, model, evolution_params._game_batch_size, max_workers)
+        elif backend == "distributed":
+            self.evaluator = DistributedEvaluator(game, model, evolution_params._game_batch_size,
+                                                  local_workers=max_workers)
+        elif backend != "threads":
+            raise NotImplementedError
+
         print("Parameters: {}".format(evolution_params.to_string()))
         print("Network: {}".format(model.to_string()))
 
@@ -66,6 +90,46 @@ class Evolution():
 
         return result,
 
+    def evaluate_population(self, toolbox, individuals, seeds):
+        """
+        Evaluates fitness of all specified individuals. If the game is batched (see game config) and the model supports
+        it, games of all individuals are played at once in lockstep and networks of all individuals are evaluated
+        by stacked matrix products (see 'AbstractModel.get_population_instance'). Otherwise, individuals are evaluated
+        one by one using 'toolbox.map', or by workers of the "processes" or "distributed" backend.
+        :param toolbox: Toolbox with registered 'map' and 'evaluate'.
+        :param individuals: Individuals to evaluate.
+        :param seeds: Seed for the game of every individual.
+        :return: Fitness of every individual (tuples, as required by Deap library).
+        """
+        population_model = None
+        if self.game_config.get("batched", False):
+            population_model = self.model.get_population_instance(individuals, self.game_config)
+        if population_model is None:
+            if self.evaluator is not None:
+                return self.evaluator.evaluate(individuals, seeds)
+            return list(toolbox.map(toolbox.evaluate, individuals, seeds))
+
+        params = [population_model, self.evolution_params._game_batch_size, None]
+        game = get_game_instance(self.current_game, params)
+        return [(result,) for result in game.run_population(seeds)]
+
+    def close(self):
+        """
+        Releases resources of the fitness evaluation backend (stops workers).
+        """
+        if self.evaluator is not None:
+            self.evaluator.close()
+
+    def print_startup_time(self):
+        """
+        Prints time spent in starting games (loading engines, creating games...) since the last call (only for games
+        recording it).
+        """
+        game_class = utils.miscellaneous.get_game_class(self.current_game)
+        startup_time = game_class.pop_startup_time()
+        if startup_time is not None:
+            print("Game startup time: {} sec".format(startup_time))
+
     def mut_random(self, individual, mutindpb):
         """
         Provides random mutation of a individual.
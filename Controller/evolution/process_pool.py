@@ -0,0 +1,198 @@
+"""
+Evaluation of fitness in worker processes (games run in parallel without sharing the GIL). Workers are long-lived:
+every worker loads the game configuration and the model (e.g. reservoir of Echo-State model) once and then evaluates
+individuals of all generations. Weights of individuals are not pickled, they are published in a shared memory block
+(one row per individual) and every worker creates models directly over the rows of the block. When a worker dies
+(e.g. crashes or is killed when out of memory), the pool is restarted and unfinished individuals are evaluated again.
+"""
+import concurrent.futures
+import multiprocessing
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from utils.miscellaneous import get_game_config, get_game_instance
+
+# State of a worker process (set by '_init_worker')
+_worker = {}
+
+
+def attach_shared_memory(name):
+    """
+    Attaches an existing shared memory block, without making the current process responsible for its removal (the
+    block is owned and removed by the process that has created it). Older versions of Python always track the
+    block, but workers share the resource tracker of the process that has started them, so it is tracked only once.
+    :param name: Name of the block.
+    :return: Instance of SharedMemory.
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+
+def _init_worker(game, model, game_batch_size):
+    """
+    Initializes a worker process.
+    :param game: Game name.
+    :param model: Model (without weights) used to create instances of individuals.
+    :param game_batch_size: Number of games played by every individual.
+    """
+    _worker["game"] = game
+    _worker["game_config"] = get_game_config(game)
+    _worker["model"] = model
+    _worker["game_batch_size"] = game_batch_size
+    _worker["memory"] = None
+    _worker["population"] = None
+
+
+def _get_population(name, shape):
+    """
+    Returns weights of all individuals published in the specified shared memory block (attached only once).
+    :param name: Name of the block.
+    :param shape: Shape of the population (individuals, individual length).
+    :return: Array of weights (view into the block).
+    """
+    memory = _worker["memory"]
+    population = _worker["population"]
+    if memory is None or memory.name != name:
+        _worker["population"] = population = None
+        if memory is not None:
+            try:
+                memory.close()
+            except BufferError:
+                pass  # some model still uses the old block; it is closed when garbage collected
+        memory = attach_shared_memory(name)
+        _worker["memory"] = memory
+    if population is None or population.shape != shape:
+        population = np.ndarray(shape, dtype=np.float64, buffer=memory.buf)
+        _worker["population"] = population
+    return population
+
+
+def _evaluate(name, shape, index, seed):
+    """
+    Evaluates fitness of a single individual in a worker process (same as 'Evolution.eval_fitness').
+    :param name: Name of the shared memory block with weights of the population.
+    :param shape: Shape of the population (individuals, individual length).
+    :param index: Index of the individual in the population.
+    :param seed: Seed for the game instance.
+    :return: Fitness of the individual.
+    """
+    weights = _get_population(name, shape)[index]
+    model = _worker["model"].get_new_instance(weights=weights, game_config=_worker["game_config"])
+    game = get_game_instance(_worker["game"], [model, _worker["game_batch_size"], seed])
+    return game.run()
+
+
+class ProcessPoolEvaluator():
+    """
+    Evaluates fitness of individuals in a pool of worker processes (started on the first use).
+    """
+
+    def __init__(self, game, model, game_batch_size, max_workers, max_retries=3):
+        """
+        Initializes a new instance of ProcessPoolEvaluator.
+        :param game: Game name.
+        :param model: Model (without weights) used to create instances of individuals, sent to every worker once.
+        :param game_batch_size: Number of games played by every individual.
+        :param max_workers: Number of worker processes.
+        :param max_retries: Number of restarts of the pool during a single evaluation after a worker has died.
+        """
+        self.game = game
+        self.model = model
+        self.game_batch_size = game_batch_size
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.executor = None
+        self.memory = None
+
+    def start(self):
+        """
+        Starts worker processes (if not running yet).
+        """
+        if self.executor is None:
+            # Spawned workers do not inherit threads or open games of the current process (and work on all systems)
+            context = multiprocessing.get_context("spawn")
+            self.executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.max_workers, mp_context=context,
+                                                                   initializer=_init_worker,
+                                                                   initargs=(self.game, self.model,
+                                                                             self.game_batch_size))
+
+    def publish(self, individuals):
+        """
+        Writes weights of the individuals into the shared memory block (reused while it is large enough).
+        :param individuals: Individuals (lists of weights of the same length).
+        :return: Name of the block and shape of the population.
+        """
+        shape = (len(individuals), len(individuals[0]))
+        size = shape[0] * shape[1] * np.dtype(np.float64).itemsize
+        if self.memory is None or self.memory.size < size:
+            self.release_memory()
+            self.memory = shared_memory.SharedMemory(create=True, size=size)
+        population = np.ndarray(shape, dtype=np.float64, buffer=self.memory.buf)
+        population[:] = individuals
+        del population  # the block can't be released while there is a view
+        return self.memory.name, shape
+
+    def evaluate(self, individuals, seeds):
+        """
+        Evaluates fitness of all specified individuals.
+        :param individuals: Individuals to evaluate.
+        :param seeds: Seed for the game of every individual.
+        :return: Fitness of every individual (tuples, as required by Deap library).
+        """
+        if len(individuals) == 0:
+            return []
+        name, shape = self.publish(individuals)
+        seeds = list(seeds)
+        results = [None] * shape[0]
+        pending = list(range(shape[0]))
+        retries = 0
+        while True:
+            self.start()
+            futures = []
+            error = None
+            try:
+                for index in pending:
+                    futures.append((index, self.executor.submit(_evaluate, name, shape, index, seeds[index])))
+            except BrokenProcessPool as e:
+                error = e  # a worker has died since the last evaluation
+            for index, future in futures:
+                try:
+                    results[index] = (future.result(),)
+                except BrokenProcessPool as e:
+                    error = e  # results of individuals finished before the worker has died are kept
+            pending = [index for index in pending if results[index] is None]
+            if not pending:
+                return results
+            if retries == self.max_retries:
+                raise error
+            retries += 1
+            print("Worker process has died, restarting workers ({} individuals left)".format(len(pending)))
+            self.stop_workers()
+
+    def release_memory(self):
+        """
+        Removes the shared memory block.
+        """
+        if self.memory is not None:
+            self.memory.close()
+            self.memory.unlink()
+            self.memory = None
+
+    def stop_workers(self):
+        """
+        Stops worker processes (started again on the next use).
+        """
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def close(self):
+        """
+        Stops worker processes and removes the shared memory block.
+        """
+        self.stop_workers()
+        self.release_memory()
@@ -1,8 +1,34 @@
 import os
+from threading import Lock
 
 
 class AbstractGame():
     """ Basic wrapper for every game used."""
+    # Total time spent in starting games (loading engines, creating games...) since the last 'pop_startup_time',
+    # None for games that don't record it
+    startup_time = None
+    startup_time_lock = Lock()
+
+    @classmethod
+    def add_startup_time(cls, seconds):
+        """
+        Adds the specified time to the startup time of the current game class.
+        :param seconds: Time to add.
+        """
+        with AbstractGame.startup_time_lock:
+            cls.startup_time = (cls.startup_time or 0) + seconds
+
+    @classmethod
+    def pop_startup_time(cls):
+        """
+        Returns total startup time of the current game class and resets it.
+        :return: Startup time in seconds, or None if the game doesn't record it.
+        """
+        with AbstractGame.startup_time_lock:
+            startup_time = cls.startup_time
+            if startup_time is not None:
+                cls.startup_time = 0
+        return startup_time
 
     def __init__(self):
         self.process = None
@@ -18,6 +44,7 @@ class AbstractGame():
         :return: Game result.
         """
         state, current_phase = self.init_process()
+        self.model.reset()
         while True:
             result = self.model.evaluate(state, current_phase)
 
@@ -28,6 +55,15 @@ class AbstractGame():
                 else:
                     return self.score
 
+    def run_population(self, seeds):
+        """
+        Runs games of all individuals of a population at once ('model' is a population model, see
+        'AbstractModel.get_population_instance'). Implemented only by games that can play many games in lockstep.
+        :param seeds: Seed of games of every individual.
+        :return: Game result of every individual.
+        """
+        raise NotImplementedError
+
     def step(self, action):
         """
         Performs a single step within the game.
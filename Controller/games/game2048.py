@@ -2,15 +2,22 @@ from games.abstract_game import AbstractGame
 from constants import *
 import importlib.util
 import utils.miscellaneous
+from utils.statistics import GameStatistics
 import numpy as np
+import time
+from threading import Lock
 
 
 class Game2048(AbstractGame):
     """
     Represents a single 2048 game.
     """
+    # Process-wide registry of loaded game engines (path -> module), engines are loaded only once
+    engines = {}
+    engines_lock = Lock()
+    game_config = None
 
-    def __init__(self, model, game_batch_size, seed, test=False):
+    def __init__(self, model, game_batch_size, seed, test=False, trajectories_file=None, report_interval=None):
         """
         Initializes a new instance of 2048 game.
         :param model: Model which will be playing this game.
@@ -18,23 +25,110 @@ class Game2048(AbstractGame):
         instance. Result is averaged.
         :param seed: A random seed for random generator within the game.
         :param test: Indicates whether the game is in testing mode.
+        :param trajectories_file: If set, games played with advanced results are recorded into this file (seed and
+        moves of every game, see 'trajectories.py').
+        :param report_interval: If set, a partial report of statistics is written after every 'report_interval' games
+        played with advanced results (useful for long runs).
         """
         super(Game2048, self).__init__()
         self.model = model
         self.game_batch_size = game_batch_size
         self.rng = np.random.RandomState(seed)
         self.phase = 0
-        self.batch_games = []
+        self.statistics = GameStatistics()
+        self.statistics_file = None
+        self.report_interval = report_interval
+        self.trajectories_file = trajectories_file
+        self.game_seed = None
+
+        # Engine (backend) of the game, selected in game config ("numpy" or "bitboard")
+        game_config = Game2048.get_game_config()
+        engine = game_config.get("engine", "numpy")
+        if engine == "numpy":
+            self.engine_path = GAME2048_PY_PATH
+        elif engine == "bitboard":
+            self.engine_path = GAME2048_BITBOARD_PY_PATH
+        else:
+            raise NotImplementedError
+
+        # Play all games of the batch at once (in lockstep), see 'run_batched'
+        self.batched = game_config.get("batched", False)
+
+        # Encoding of game states, selected in game config ("raw" or "onehot"), see 'state_encoders.py'
+        self.encoding = game_config.get("encoding", "raw")
+        self.input_size = game_config["input_sizes"][self.phase]
+        self.encoder = None
+
+    def get_encoder(self, n=None):
+        """
+        Creates encoder of game states (selected in game config).
+        :param n: Number of boards encoded at once (batch engine), or None for a single board.
+        :return: New instance of encoder.
+        """
+        state_encoders = Game2048.load_engine(GAME2048_ENCODERS_PY_PATH)
+        encoder = state_encoders.get_encoder(self.encoding, n=n)
+        if encoder.size != self.input_size:
+            raise ValueError("Encoding '{}' has size {}, but input size in game config is {}.".format(
+                self.encoding, encoder.size, self.input_size))
+        return encoder
+
+    @staticmethod
+    def get_game_config():
+        """
+        Returns game configuration of 2048 (loaded only once per process).
+        :return: Game configuration dictionary.
+        """
+        with Game2048.engines_lock:
+            if Game2048.game_config is None:
+                Game2048.game_config = utils.miscellaneous.get_game_config("2048")
+            return Game2048.game_config
+
+    @staticmethod
+    def load_engine(path):
+        """
+        Returns module with game engine from the specified file. The module is executed only for the first time,
+        then it is reused by all games in the process.
+        :param path: Path to the engine file.
+        :return: Loaded module.
+        """
+        engine = Game2048.engines.get(path)
+        if engine is not None:
+            return engine
+
+        with Game2048.engines_lock:
+            if path not in Game2048.engines:
+                spec = importlib.util.spec_from_file_location("Game", path)
+                engine = importlib.util.module_from_spec(spec)
+                spec.loader.exec_module(engine)
+                Game2048.engines[path] = engine
+            return Game2048.engines[path]
+
+    @staticmethod
+    def reload_engine(path=None):
+        """
+        Forgets loaded engine (and game configuration), so it is loaded again from the file by the next game. Use
+        when the engine file has changed.
+        :param path: Path to the engine file, or None to reload all engines.
+        """
+        with Game2048.engines_lock:
+            if path is None:
+                Game2048.engines.clear()
+            else:
+                Game2048.engines.pop(path, None)
+            Game2048.game_config = None
 
     def init_process(self):
         """
         Initializes a new 2048 game.
         """
-        spec = importlib.util.spec_from_file_location("Game", GAME2048_PY_PATH)
-        game_2048 = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(game_2048)
-        self.game = game_2048.Game(self.rng.randint(0, 2 ** 30))
+        start = time.time()
+        game_2048 = Game2048.load_engine(self.engine_path)
+        if self.encoder is None:
+            self.encoder = self.get_encoder()  # shared by all games of the batch
+        self.game_seed = self.rng.randint(0, 2 ** 30)
+        self.game = game_2048.Game(self.game_seed, encoder=self.encoder)
         state = self.game.get_state()
+        Game2048.add_startup_time(time.time() - start)
         return state, self.phase
 
     def run(self, advanced_results=False):
@@ -42,62 +136,110 @@ class Game2048(AbstractGame):
         Runs a whole game and returns result.
         :return: Game result.
         """
+        if self.batched and not advanced_results:
+            return self.run_batched()
+
+        if advanced_results:
+            self.statistics = GameStatistics()
+            self.statistics_file = "game2048_statistics_{}.txt".format(utils.miscellaneous.get_pretty_time())
+
+        recorder = None
+        if advanced_results and self.trajectories_file is not None:
+            trajectories = Game2048.load_engine(GAME2048_TRAJECTORIES_PY_PATH)
+            recorder = trajectories.TrajectoryWriter(self.trajectories_file)
+
         score_total = 0
-        for _ in range(self.game_batch_size):
-            state, phase = self.init_process()
-            while not self.game.end:
-                result = self.model.evaluate(state, phase)
-                result = np.argsort(np.array(result))[::-1]
-                for a in result:
-                    moved, _ = self.game.move(a)
-                    if moved:
-                        break
-
-                state = self.game.get_state()
-            score_total += self.game.score
-
-            if advanced_results:
-                self.batch_games.append(self.game)
+        try:
+            for _ in range(self.game_batch_size):
+                state, phase = self.init_process()
+                self.model.reset()
+                if recorder is not None:
+                    recorder.begin(self.game_seed)
+                while not self.game.end:
+                    result = self.model.evaluate(state, phase)
+                    result = np.argsort(np.array(result))[::-1]
+                    for a in result:
+                        moved, reward = self.game.move(a)
+                        if moved:
+                            if recorder is not None:
+                                recorder.add(a, reward)
+                            break
+
+                    state = self.game.get_state()
+                score_total += self.game.score
+
+                if recorder is not None:
+                    recorder.end(self.game.score)
+                if advanced_results:
+                    self.statistics.add(self.game.max(), self.game.score, self.game.total_moves)
+                    if (self.report_interval and self.statistics.count % self.report_interval == 0 and
+                            self.statistics.count < self.game_batch_size):  # the last report is the final one
+                        self.log_statistics(partial=True)
+        finally:
+            if recorder is not None:
+                recorder.close()
 
         if advanced_results:
             self.log_statistics()
 
         return score_total / self.game_batch_size
 
-    def log_statistics(self):
+    def run_batched(self):
         """
-        Logs statistics of games that have run (statistics of 'game-batch-size' games).
+        Runs all 'game_batch_size' games at once, using vectorized batch engine. In every step, model is evaluated
+        for all running games at once ('evaluate_batch') and each game plays its most preferred legal move.
+        :return: Average score of games.
         """
-        counts = {}
-        for g in self.batch_games:
-            m = g.max()
-            if m in counts:
-                counts[m] += 1
-            else:
-                counts[m] = 1
-
-        print(counts)
-
-        file_name = "game2048_statistics_{}.txt".format(utils.miscellaneous.get_pretty_time())
-        with open(file_name, "w") as f:
-            f.write("--GAME 2048 STATISTICS--")
-            f.write(os.linesep)
-            f.write("Model: {}".format(self.model.get_name()))
-            f.write(os.linesep)
-            f.write("Total games: {}, Average score: {}, Average moves: {}".format(self.game_batch_size,
-                                                                                   np.mean([s.score for s in
-                                                                                            self.batch_games]),
-                                                                                   np.mean([s.total_moves for s in
-                                                                                            self.batch_games])))
-            f.write(os.linesep)
-            f.write("Reached tiles:")
-            f.write(os.linesep)
-
-            width = 5
-            for key in sorted(counts):
-                f.write("{}: {} = {}%".format(str(key).rjust(width), str(counts[key]).rjust(width),
-                                              str(100 * counts[key] / self.game_batch_size).rjust(width)))
-                f.write(os.linesep)
+        start = time.time()
+        game_2048_batch = Game2048.load_engine(GAME2048_BATCH_PY_PATH)
+        seeds = self.rng.randint(0, 2 ** 30, size=self.game_batch_size)
+        games = game_2048_batch.GameBatch(seeds)
+        encoder = self.get_encoder(n=games.n)
+        Game2048.add_startup_time(time.time() - start)
+
+        self.model.reset()
+        preferences = np.zeros(shape=(games.n, 4))
+        while not games.end.all():
+            states = games.get_state(encoder)
+            running = np.flatnonzero(~games.end)  # finished games are left out
+            preferences[running] = self.model.evaluate_batch(states[running], self.phase, running)
+            games.move_ranked(preferences)
+
+        return np.mean(games.score)
+
+    def run_population(self, seeds):
+        """
+        Runs 'game_batch_size' games of every individual of a population, all games at once (in lockstep) using
+        vectorized batch engine. In every step, networks of all individuals are evaluated at once.
+        :param seeds: Seed of every individual (games of the individual are the same as in 'run_batched' of a game
+        created with this seed).
+        :return: Average score of every individual.
+        """
+        start = time.time()
+        game_2048_batch = Game2048.load_engine(GAME2048_BATCH_PY_PATH)
+        individuals = len(seeds)
+        game_seeds = np.concatenate([np.random.RandomState(seed).randint(0, 2 ** 30, size=self.game_batch_size)
+                                     for seed in seeds])
+        games = game_2048_batch.GameBatch(game_seeds)
+        encoder = self.get_encoder(n=games.n)
+        Game2048.add_startup_time(time.time() - start)
+
+        while not games.end.all():
+            states = games.get_state(encoder).reshape(individuals, self.game_batch_size, -1)
+            preferences = self.model.predict(states, self.phase)
+            games.move_ranked(preferences.reshape(games.n, -1))  # finished games are ignored
+
+        return games.score.reshape(individuals, self.game_batch_size).mean(axis=1)
+
+    def log_statistics(self, partial=False):
+        """
+        Logs statistics of games that have run (statistics of 'game-batch-size' games). The report file is overwritten
+        by every (partial) report.
+        :param partial: Indicates whether the games are still running (only part of games has been played).
+        """
+        print(self.statistics.tiles)
+        title = "--GAME 2048 STATISTICS--" + (" (partial)" if partial else "")
+        self.statistics.write_report(self.statistics_file, title, self.model.get_name(), self.game_batch_size)
 
     def step(self, action):
         """
@@ -39,6 +39,7 @@ class Torcs(AbstractGame):
         avg_result = 0
         for _ in range(self.game_batch_size):
             state, current_phase = self.init_process()
+            self.model.reset()
             while True:
                 result = self.model.evaluate(state, current_phase)
 
@@ -22,6 +22,14 @@
 
 # CHANGE LOG:
 # Initializing changed - Init moved to separate method from _fit_transform(...).
+# Added transform_batch(...) - transforms independent samples at once.
+# Added dtype - precision of the reservoir (float64 or float32).
+# Added connectivity and input_connectivity - sparse (CSR) reservoir and input weights.
+# Added radius_estimator - fast estimators of spectral radius, scaled reservoirs are cached.
+# Added cache_dir and cache_size - reservoirs stored on disk (limited size) and memory-mapped read-only.
+# transform(...) does not write into the shared components_ buffer, state of the reservoir can be given by the caller.
+# Added step(...) - single step of the reservoir, updates the state in place using preallocated buffers.
+# Added step_batch(...) - single step of reservoirs of many games at once (state matrix, one product per step).
 #
 #################################
 
@@ -30,12 +38,143 @@
 # TODO: add n_readout = -1 for n_readout = n_components
 
 from __future__ import print_function
-import sys
+import os
+import shutil
+import tempfile
+import hashlib
+from collections import OrderedDict
+from threading import Lock
 from sklearn.base import TransformerMixin, BaseEstimator
 from sklearn.utils import check_random_state, check_array
-from numpy import zeros, ones, concatenate, array, tanh, vstack, arange
+from numpy import zeros, ones, concatenate, tanh, arange
 import numpy as np
 import scipy.linalg as la
+import scipy.sparse as sp
+import scipy.sparse.linalg as spla
+
+
+# Scaled reservoirs generated from integer seeds, least recently used first:
+# (seed, settings) -> (weights_, state of the random generator after weights_)
+_reservoirs = OrderedDict()
+_reservoirs_lock = Lock()
+# Maximum number of reservoirs kept in _reservoirs (evolutions may draw a new seed for every model)
+RESERVOIRS_CACHE_SIZE = 4
+
+
+# Version of the reservoir generation (part of keys of reservoirs stored on disk)
+RESERVOIR_VERSION = 1
+RESERVOIR_ARRAYS = ("weights_", "input_weights_", "readout_idx_")
+
+
+def save_reservoir(path, arrays):
+    """Store arrays of a reservoir (name -> dense array or CSR matrix)
+
+    Every array is stored as a .npy file (CSR matrices as .data, .indices,
+    .indptr and .shape files). Files are written into a temporary
+    directory renamed to path at the end, so readers never see a partial
+    reservoir; if another process stores the same reservoir first, its
+    files are kept. The directory is readable by all users (the cache can
+    be shared).
+    """
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    temp = tempfile.mkdtemp(prefix=".tmp-", dir=directory)
+    os.chmod(temp, 0o755)  # mkdtemp creates a private directory
+    for name, value in arrays.items():
+        if sp.issparse(value):
+            value = sp.csr_matrix(value)
+            for part in ("data", "indices", "indptr"):
+                np.save(os.path.join(temp, "{}.{}.npy".format(name, part)), getattr(value, part))
+            np.save(os.path.join(temp, "{}.shape.npy".format(name)), np.array(value.shape))
+        else:
+            np.save(os.path.join(temp, name + ".npy"), value)
+    try:
+        os.rename(temp, path)
+    except OSError:
+        shutil.rmtree(temp, ignore_errors=True)
+
+
+def load_reservoir(path, names):
+    """Memory-map arrays of a reservoir stored by save_reservoir (read-only)
+
+    The reservoir is marked as recently used (see prune_reservoirs).
+    """
+    arrays = {}
+    for name in names:
+        file_name = os.path.join(path, name + ".npy")
+        if os.path.exists(file_name):
+            arrays[name] = np.load(file_name, mmap_mode="r")
+        else:
+            parts = [np.load(os.path.join(path, "{}.{}.npy".format(name, part)), mmap_mode="r")
+                     for part in ("data", "indices", "indptr")]
+            shape = tuple(np.load(os.path.join(path, "{}.shape.npy".format(name))))
+            arrays[name] = sp.csr_matrix(tuple(parts), shape=shape, copy=False)
+    os.utime(path)
+    return arrays
+
+
+def prune_reservoirs(directory, max_size, keep=None):
+    """Remove least recently used reservoirs stored in directory
+
+    Reservoirs are removed until all of them take at most max_size bytes.
+    Processes that have already memory-mapped a removed reservoir keep
+    using it (on POSIX systems); keep is never removed.
+    """
+    reservoirs = []
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if name.startswith(".tmp-") or not os.path.isdir(path):
+            continue
+        try:
+            size = sum(os.path.getsize(os.path.join(path, file_name)) for file_name in os.listdir(path))
+            reservoirs.append((os.path.getmtime(path), size, path))
+        except OSError:
+            continue  # removed by another process
+    total = sum(size for _, size, _ in reservoirs)
+    for _, size, path in sorted(reservoirs):
+        if total <= max_size:
+            break
+        if path != keep:
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+
+def _dot(matrix, vector, out):
+    """Product of a dense or sparse matrix and a vector, written into out"""
+    if sp.issparse(matrix):
+        out[:] = matrix.dot(vector)
+        return out
+    return np.dot(matrix, vector, out=out)
+
+
+def spectral_radius(weights, estimator="auto"):
+    """Largest absolute eigenvalue of a dense or sparse (CSR) matrix
+
+    Estimators:
+    'exact' - full eigendecomposition, O(n^3) (sparse matrices are
+              converted to dense ones),
+    'arpack' - largest magnitude eigenvalue by ARPACK (relative tolerance
+               1e-3), starting from a fixed vector so that the result is
+               deterministic,
+    'circular' - closed form for random matrices with i.i.d. zero-mean
+                 entries (circular law): sqrt(sum of squared weights / n),
+    'auto' - 'arpack' for sparse matrices, 'exact' for dense ones.
+    """
+    n = weights.shape[0]
+    if estimator == "auto":
+        estimator = "arpack" if sp.issparse(weights) else "exact"
+    if estimator == "circular":
+        squares = weights.power(2).sum() if sp.issparse(weights) else np.sum(weights ** 2)
+        return np.sqrt(squares / n)
+    if estimator == "arpack" and n > 2:
+        eigenvalues = spla.eigs(weights.astype(np.float64), k=1, which="LM", tol=1e-3,
+                                ncv=min(n, 64), v0=np.ones(n), return_eigenvectors=False)
+        return np.max(np.abs(eigenvalues))
+    if estimator not in ("exact", "arpack"):
+        raise ValueError("Unknown spectral radius estimator: {}".format(estimator))
+    if sp.issparse(weights):
+        weights = weights.toarray()
+    return np.max(np.abs(la.eig(weights)[0]))
 
 
 class SimpleESN(BaseEstimator, TransformerMixin):
@@ -70,6 +209,38 @@ class SimpleESN(BaseEstimator, TransformerMixin):
 
     random_state : integer or numpy.RandomState, optional
         Random number generator instance. If integer, fixes the seed.
+
+    dtype : numpy type, optional
+        Type of the reservoir weights and activations (float64 or float32).
+        Weights are generated the same way for any type, then converted.
+
+    connectivity : float, optional
+        Fraction of non-zero reservoir connections (e.g. 0.01 to 0.05). If
+        given, the reservoir is stored as a sparse (CSR) matrix, so the cost
+        of a step is proportional to the number of connections. Dense by
+        default.
+
+    input_connectivity : float, optional
+        Fraction of non-zero input weights; sparse (CSR) input weights if
+        given, dense by default.
+
+    radius_estimator : str, optional
+        Estimator of the spectral radius used to scale the reservoir, see
+        spectral_radius ('auto' by default). If random_state is an integer,
+        the scaled reservoir is cached and reused by all ESNs with the same
+        seed and settings.
+
+    cache_dir : str, optional
+        Directory of reservoirs stored on disk. If given (and random_state
+        is an integer), weights, input weights and readout indices are
+        loaded from the directory as read-only memory-mapped arrays, shared
+        by all processes using the same reservoir; a missing reservoir is
+        generated and stored first.
+
+    cache_size : int, optional
+        Maximum total size of reservoirs in cache_dir in bytes; least
+        recently used reservoirs are removed when a new one is stored.
+        Unlimited by default.
         
     Attributes
     ----------
@@ -89,53 +260,134 @@ class SimpleESN(BaseEstimator, TransformerMixin):
     """
 
     def __init__(self, n_readout, n_components, damping=0.5,
-                 weight_scaling=0.9, discard_steps=0, random_state=None):
+                 weight_scaling=0.9, discard_steps=0, random_state=None, dtype=np.float64,
+                 connectivity=None, input_connectivity=None, radius_estimator="auto", cache_dir=None,
+                 cache_size=None):
         self.n_readout = n_readout
         self.n_components = n_components
         self.damping = damping
         self.weight_scaling = weight_scaling
         self.discard_steps = discard_steps
+        self.seed = random_state if isinstance(random_state, (int, np.integer)) else None
         self.random_state = check_random_state(random_state)
+        self.dtype = dtype
+        self.connectivity = connectivity
+        self.input_connectivity = input_connectivity
+        self.radius_estimator = radius_estimator
+        self.cache_dir = cache_dir
+        self.cache_size = cache_size
         self.input_weights_ = None
         self.readout_idx_ = None
         self.weights_ = None
 
+    def _random_weights(self, n_rows, n_columns, connectivity):
+        """Uniform weights in [-0.5, 0.5), sparse (CSR) if connectivity is given"""
+        if connectivity is None:
+            return self.random_state.rand(n_rows, n_columns) - 0.5
+        # Generator samples positions of connections much faster than RandomState
+        rng = np.random.default_rng(self.random_state.randint(2 ** 31))
+        return sp.random(n_rows, n_columns, density=connectivity, format="csr",
+                         random_state=rng, data_rvs=lambda k: rng.random(k) - 0.5)
+
+    def _scaled_weights(self):
+        """Random reservoir scaled to weight_scaling spectral radius"""
+        weights = self._random_weights(self.n_components, self.n_components, self.connectivity)
+        weights *= self.weight_scaling / spectral_radius(weights, self.radius_estimator)
+        return weights.astype(self.dtype, copy=False)
+
+    def _cached_weights(self):
+        """Scaled reservoir of the seed from cache (generated on a miss)
+
+        Only the RESERVOIRS_CACHE_SIZE most recently used reservoirs are
+        kept (ESNs using a reservoir keep it alive). The random generator
+        is left in the same state as after generating the reservoir, so
+        input weights and readout indices do not depend on whether the
+        reservoir was cached.
+        """
+        key = (self.seed, self.n_components, self.weight_scaling, self.connectivity,
+               self.radius_estimator, np.dtype(self.dtype).name)
+        with _reservoirs_lock:
+            if key in _reservoirs:
+                _reservoirs.move_to_end(key)
+            else:
+                weights = self._scaled_weights()
+                if not sp.issparse(weights):
+                    weights.flags.writeable = False  # shared by all ESNs of the seed
+                _reservoirs[key] = (weights, self.random_state.get_state())
+                while len(_reservoirs) > RESERVOIRS_CACHE_SIZE:
+                    _reservoirs.popitem(last=False)
+            weights, state = _reservoirs[key]
+        self.random_state.set_state(state)
+        return weights
+
+    def _reservoir_key(self, n_features):
+        """Name of the reservoir on disk (hash of seed and all settings)"""
+        settings = (RESERVOIR_VERSION, int(self.seed), self.n_readout, self.n_components, n_features,
+                    self.weight_scaling, self.connectivity, self.input_connectivity,
+                    self.radius_estimator, np.dtype(self.dtype).name)
+        return hashlib.sha1(repr(settings).encode("ascii")).hexdigest()
+
     def init_weights(self, n_samples, n_features):
+        if self.weights_ is None and self.cache_dir is not None and self.seed is not None:
+            path = os.path.join(self.cache_dir, self._reservoir_key(n_features))
+            try:
+                if not os.path.isdir(path):
+                    self._generate_weights(n_features)
+                    save_reservoir(path, {name: getattr(self, name) for name in RESERVOIR_ARRAYS})
+                    if self.cache_size is not None:
+                        prune_reservoirs(self.cache_dir, self.cache_size, keep=path)
+                arrays = load_reservoir(path, RESERVOIR_ARRAYS)
+            except OSError:
+                arrays = {}  # removed by another process, weights are kept in memory
+            for name, value in arrays.items():
+                setattr(self, name, value)
+        self._generate_weights(n_features)
+        self._init_step()
+
+    def _init_step(self):
+        """Split input weights to bias and input matrix, and map readout indices to reservoir neurons (for step)"""
+        if sp.issparse(self.input_weights_):
+            input_weights = sp.csc_matrix(self.input_weights_)
+            self.input_bias_ = input_weights[:, 0].toarray().ravel()
+            self.input_matrix_ = sp.csr_matrix(input_weights[:, 1:])
+        else:
+            self.input_bias_ = self.input_weights_[:, 0]
+            self.input_matrix_ = self.input_weights_[:, 1:]
+        self.readout_neurons_ = self.readout_idx_ - self.input_weights_.shape[1]
+
+    def _generate_weights(self, n_features):
+        """Generate missing weights, input weights and readout indices"""
         if self.weights_ is None:
-            self.weights_ = self.random_state.rand(self.n_components,
-                                                   self.n_components) - 0.5
-            spectral_radius = np.max(np.abs(la.eig(self.weights_)[0]))
-            self.weights_ *= self.weight_scaling / spectral_radius
+            if self.seed is None:
+                self.weights_ = self._scaled_weights()
+            else:
+                self.weights_ = self._cached_weights()
         if self.input_weights_ is None:
-            self.input_weights_ = self.random_state.rand(self.n_components,
-                                                         1 + n_features) - 0.5
+            self.input_weights_ = self._random_weights(self.n_components, 1 + n_features,
+                                                       self.input_connectivity).astype(self.dtype, copy=False)
         if self.readout_idx_ is None:
             self.readout_idx_ = self.random_state.permutation(arange(1 + n_features,
                                                                      1 + n_features + self.n_components))[
                                 :self.n_readout]
-        self.components_ = zeros(shape=(1 + n_features + self.n_components,
-                                        n_samples))
 
     def _fit_transform(self, X):
-        n_samples, n_features = X.shape
         X = check_array(X, ensure_2d=True)
-        self.weights_ = self.random_state.rand(self.n_components, self.n_components) - 0.5
-        spectral_radius = np.max(np.abs(la.eig(self.weights_)[0]))
-        self.weights_ *= self.weight_scaling / spectral_radius
-        self.input_weights_ = self.random_state.rand(self.n_components,
-                                                     1 + n_features) - 0.5
-        self.readout_idx_ = self.random_state.permutation(arange(1 + n_features,
-                                                                 1 + n_features + self.n_components))[:self.n_readout]
+        n_samples, n_features = X.shape
+        self.init_weights(n_samples, n_features)  # the same network as init_weights
         self.components_ = zeros(shape=(1 + n_features + self.n_components,
-                                        n_samples))
+                                        n_samples), dtype=self.dtype)
 
-        curr_ = zeros(shape=(self.n_components, 1))
-        U = concatenate((ones(shape=(n_samples, 1)), X), axis=1)
+        state = self.new_state()
+        U = concatenate((ones(shape=(n_samples, 1)), X), axis=1).astype(self.dtype, copy=False)
         for t in range(n_samples):
-            u = array(U[t, :], ndmin=2).T
-            curr_ = (1 - self.damping) * curr_ + self.damping * tanh(
-                self.input_weights_.dot(u) + self.weights_.dot(curr_))
-            self.components_[:, t] = vstack((u, curr_))[:, 0]
+            echo = self.input_weights_.dot(U[t])
+            echo += self.weights_.dot(state)
+            tanh(echo, out=echo)
+            echo *= self.damping
+            state *= 1 - self.damping
+            state += echo
+            self.components_[:1 + n_features, t] = U[t]
+            self.components_[1 + n_features:, t] = state
         return self
 
     def fit(self, X, y=None):
@@ -172,7 +424,20 @@ class SimpleESN(BaseEstimator, TransformerMixin):
         self = self._fit_transform(X)
         return self.components_[self.readout_idx_, self.discard_steps:].T
 
-    def transform(self, X):
+    def new_state(self):
+        """Initial (zero) state of the reservoir
+
+        Weights of the reservoir are never modified after initialization,
+        so a single ESN can be used by many threads at once, as long as
+        every thread (game) uses its own state.
+
+        Returns
+        -------
+        state : array, shape (n_components,)
+        """
+        return zeros(self.n_components, dtype=self.dtype)
+
+    def transform(self, X, state=None):
         """Generate echoes from the reservoir
 
         Parameters
@@ -180,6 +445,10 @@ class SimpleESN(BaseEstimator, TransformerMixin):
         X : array-like shape, (n_samples, n_features)
             The data to be transformed.
 
+        state : array, shape (n_components,), optional
+            Initial state of the reservoir (see new_state), updated in place
+            to the state after the last sample. Zero state if not given.
+
         Returns
         -------
         readout : array, shape (n_samples, n_readout)
@@ -188,12 +457,134 @@ class SimpleESN(BaseEstimator, TransformerMixin):
         X = check_array(X, ensure_2d=True)
         n_samples, n_features = X.shape
 
-        curr_ = zeros(shape=(self.n_components, 1))
-        U = concatenate((ones(shape=(n_samples, 1)), X), axis=1)
+        if state is None:
+            state = self.new_state()
+        readout_idx = self.readout_idx_ - (1 + n_features)  # readout neurons are never inputs
+        readout = zeros(shape=(n_samples, len(readout_idx)), dtype=self.dtype)
+        U = concatenate((ones(shape=(n_samples, 1)), X), axis=1).astype(self.dtype, copy=False)
         for t in range(n_samples):
-            u = array(U[t, :], ndmin=2).T
-            curr_ = (1 - self.damping) * curr_ + self.damping * tanh(
-                self.input_weights_.dot(u) + self.weights_.dot(curr_))
-            self.components_[:, t] = vstack((u, curr_))[:, 0]
+            echo = self.input_weights_.dot(U[t])
+            echo += self.weights_.dot(state)
+            tanh(echo, out=echo)
+            echo *= self.damping
+            state *= 1 - self.damping
+            state += echo
+            readout[t] = state[readout_idx]
 
-        return self.components_[self.readout_idx_, self.discard_steps:].T
+        return readout[self.discard_steps:]
+
+    def new_buffers(self):
+        """Preallocated buffers of step (two vectors of n_components)
+
+        Returns
+        -------
+        buffers : array, shape (2, n_components)
+        """
+        return zeros((2, self.n_components), dtype=self.dtype)
+
+    def step(self, u, state, buffers=None, out=None):
+        """Advance the reservoir by a single sample
+
+        The same as transform of a single sample, but the state is updated
+        in place and no arrays are allocated if all buffers are given.
+
+        Parameters
+        ----------
+        u : array, shape (n_features,)
+            The sample (of dtype of the reservoir).
+
+        state : array, shape (n_components,)
+            State of the reservoir (see new_state), updated in place.
+
+        buffers : array, shape (2, n_components), optional
+            Preallocated buffers (see new_buffers).
+
+        out : array, shape (n_readout,), optional
+            Array for the result.
+
+        Returns
+        -------
+        readout : array, shape (n_readout,)
+            Activation of the readout neurons after the step
+        """
+        if buffers is None:
+            buffers = self.new_buffers()
+        echo, recurrent = buffers
+        _dot(self.input_matrix_, u, echo)
+        echo += self.input_bias_
+        echo += _dot(self.weights_, state, recurrent)
+        tanh(echo, out=echo)
+        echo *= self.damping
+        state *= 1 - self.damping
+        state += echo
+        return np.take(state, self.readout_neurons_, out=out)
+
+    def new_state_batch(self, n_games):
+        """Initial (zero) states of reservoirs of many games
+
+        Returns
+        -------
+        states : array, shape (n_components, n_games)
+        """
+        return zeros((self.n_components, n_games), dtype=self.dtype)
+
+    def step_batch(self, U, states, games=None):
+        """Advance reservoirs of many games by a single sample of every game
+
+        All games are advanced by a single matrix product. Games that do
+        not take part in the step (e.g. finished games) are left out by
+        games; their states are not changed.
+
+        Parameters
+        ----------
+        U : array, shape (n_samples, n_features)
+            A sample of every game that takes part in the step.
+
+        states : array, shape (n_components, n_games)
+            States of reservoirs of all games (see new_state_batch), updated
+            in place.
+
+        games : array of int, shape (n_samples,), optional
+            Column of states of every sample; all columns in order if None.
+
+        Returns
+        -------
+        readout : array, shape (n_samples, n_readout)
+            Activation of the readout neurons of the games after the step
+        """
+        U = np.asarray(U, dtype=self.dtype)
+        current = states if games is None else states[:, games]
+        echo = self.input_matrix_.dot(U.T)
+        echo += self.input_bias_[:, np.newaxis]
+        echo += self.weights_.dot(current)
+        tanh(echo, out=echo)
+        echo *= self.damping
+        current *= 1 - self.damping
+        current += echo
+        if games is not None:
+            states[:, games] = current
+        return current[self.readout_neurons_].T
+
+    def transform_batch(self, X):
+        """Generate echoes of independent samples
+
+        Every sample starts from the initial (zero) state of the reservoir,
+        so the result is the same as calling transform on every sample
+        separately, but all samples are processed by a single matrix product.
+
+        Parameters
+        ----------
+        X : array-like shape, (n_samples, n_features)
+            The data to be transformed.
+
+        Returns
+        -------
+        readout : array, shape (n_samples, n_readout)
+            Reservoir activation generated by the readout neurons
+        """
+        X = check_array(X, ensure_2d=True)
+        n_samples, n_features = X.shape
+
+        U = concatenate((ones(shape=(n_samples, 1)), X), axis=1).astype(self.dtype, copy=False)
+        curr_ = self.damping * tanh(self.input_weights_.dot(U.T).T)
+        return curr_[:, self.readout_idx_ - (1 + n_features)]
@@ -1,3 +1,6 @@
+import numpy as np
+
+
 class AbstractModel():
     """
     Wrapper for all models for evaluating input from a game.
@@ -13,6 +16,61 @@ class AbstractModel():
     def evaluate(self, input, current_phase):
         raise NotImplementedError
 
+    def reset(self):
+        """
+        Resets internal state of the model before a new game (for models keeping a state between steps of a game).
+        """
+        pass
+
+    def evaluate_batch(self, states, phases, games=None):
+        """
+        Evaluates a batch of states (e.g. states of games played in lockstep). Models override this with a vectorized
+        version; by default, states are evaluated one by one using 'evaluate'.
+        :param states: States of games (array of shape (N, input size) or a list of N states).
+        :param phases: Game phase of every state (list of N phases), or a single phase of all states.
+        :param games: Index of the game of every state (used by models keeping a state of every game between steps,
+        see 'reset'), or None if states are independent.
+        :return: Outputs of the model, one per state (array of shape (N, output size) if all states are in the same
+        phase, list of N outputs otherwise).
+        """
+        return AbstractModel.evaluate_grouped(states, phases,
+                                              lambda x, phase, indices: np.array([self.evaluate(s, phase) for s in x]))
+
+    @staticmethod
+    def evaluate_grouped(states, phases, predict):
+        """
+        Evaluates a batch of states grouped by their phases (phase networks may have different sizes).
+        :param states: States of games (array of shape (N, input size) or a list of N states).
+        :param phases: Game phase of every state (list of N phases), or a single phase of all states.
+        :param predict: Function predict(inputs, phase, indices), evaluates inputs of shape (M, input size) in the
+        phase; indices are positions of the inputs in the batch (None if the inputs are the whole batch).
+        :return: Outputs of the model, one per state (see 'evaluate_batch').
+        """
+        n = len(states)
+        if n == 0:
+            return []
+        phases = np.broadcast_to(np.asarray(phases), (n,))
+        unique = np.unique(phases)
+        if len(unique) == 1:
+            return predict(np.asarray(states, dtype=float), int(unique[0]), None)
+
+        outputs = [None] * n
+        for phase in unique:
+            indices = np.flatnonzero(phases == phase)
+            results = predict(np.array([states[i] for i in indices], dtype=float), int(phase), indices)
+            for i, result in zip(indices, results):
+                outputs[i] = result
+        return outputs
+
+    def get_population_instance(self, population, game_config):
+        """
+        Creates a model evaluating all individuals of a population at once (see 'MLP.MLPPopulation').
+        :param population: Weights of all individuals.
+        :param game_config: Game configuration file.
+        :return: Population model, or None if the model doesn't support it.
+        """
+        return None
+
     def get_number_of_parameters(self, game):
         raise NotImplementedError
 
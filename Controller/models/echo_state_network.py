@@ -1,11 +1,14 @@
 import numpy as np
 import json
+import constants
 import utils.activations
+import utils.normalizations
 import utils.miscellaneous
 import lib.simple_esn
 from threading import Lock
 
 from models.abstract_model import AbstractModel
+from models.layer_layout import LayerLayout, as_weights, get_dtype
 
 
 class EchoState(AbstractModel):
@@ -15,6 +18,9 @@ class EchoState(AbstractModel):
     state_check_lock = Lock()
     library_esn = None
     echo_state_seed = None
+    # Directory of reservoirs stored on disk (see 'lib.simple_esn.SimpleESN'), None to always generate reservoirs
+    reservoir_cache_dir = constants.ESN_RESERVOIR_CACHE_DIR
+    reservoir_cache_size = constants.ESN_RESERVOIR_CACHE_SIZE
 
     @staticmethod
     def load_from_file(file_name, game):
@@ -35,39 +41,59 @@ class EchoState(AbstractModel):
             n_readouts = int(model["n_readouts"])
             n_components = int(model["n_components"])
             seed = int(model["echo_state_seed"])
+            precision = model.get("precision", "float64")
+            connectivity = model.get("connectivity")
+            input_connectivity = model.get("input_connectivity")
+            # Older models were scaled by the exact spectral radius
+            radius_estimator = model.get("radius_estimator", "auto")
+            keep_echo = model.get("keep_echo", False)
         except:
             raise ValueError("File has wrong format.")
 
         game_config = utils.miscellaneous.get_game_config(game)
         print("Loading Echo-State model from file {}".format(file_name))
-        return EchoState(n_readouts, n_components, hidden, activation, weights, game_config, seed)
+        return EchoState(n_readouts, n_components, hidden, activation, weights, game_config, seed,
+                         precision=precision, connectivity=connectivity, input_connectivity=input_connectivity,
+                         radius_estimator=radius_estimator, keep_echo=keep_echo)
 
     class EchoStateNetwork():
         """
         Represents Echo-State network model (internally). Single Network.
         """
 
-        def __init__(self, layer_sizes, activation, weights):
+        def __init__(self, reservoir, layer_sizes, activation, weights, layout=None, phase=0, dtype=np.float64,
+                     normalization=utils.normalizations.DEFAULT_NORMALIZATION, keep_echo=False):
             """
             Initializes a new instance of EchoStateNetwork (internal representation; single network).
+            :param reservoir: Reservoir (instance of SimpleESN with initialized weights, shared by all networks).
             :param layer_sizes: Sizes of output layers.
             :param activation: Activation for output layers.
-            :param weights: Weights of the output layers.
+            :param weights: Weights of the output layers (flat float array, buffer or list, see 'as_weights').
+            :param layout: Layout of weights (or None if weights contain only this network).
+            :param phase: Game phase of the network in the layout.
+            :param dtype: Type of weights and computations (float64 or float32).
+            :param normalization: Normalization of outputs (see 'utils.normalizations').
+            :param keep_echo: If true, state of the reservoir is kept between steps (until 'reset'), otherwise every
+            input is processed from the initial state.
             """
+            self.reservoir = reservoir
+            self.keep_echo = keep_echo
+            # State of the reservoir of this network only, and preallocated buffers of reservoir steps
+            self.state = reservoir.new_state()
+            self.buffers = reservoir.new_buffers()
+            self.batch_states = None  # states of games evaluated in batches (see 'predict_batch')
+            self.readout = np.zeros(reservoir.n_readout, dtype=dtype)
             self.layer_sizes = layer_sizes
             self.activation = utils.activations.get_activation(activation)
-            self.weights = weights
-
-            weights = np.array(list(map(float, self.weights)))
-            l_bound = 0
-            r_bound = 0
-            self.matrices = []
-            for i in range(len(self.layer_sizes) - 1):
-                m = self.layer_sizes[i] + 1
-                n = self.layer_sizes[i + 1]
-                r_bound += m * n
-                self.matrices.append(weights[l_bound:r_bound:1].reshape(m, n))
-                l_bound = r_bound
+            self.normalize = utils.normalizations.get_normalization(normalization)
+            self.dtype = dtype
+            self.bias = np.ones(1, dtype=dtype)
+            self.weights = as_weights(weights, dtype)
+            if layout is None:
+                layout = LayerLayout.sequential([layer_sizes])
+
+            # Matrices are views into the weight vector (no copy)
+            self.matrices = layout.get_matrices(self.weights, phase)
 
         def predict(self, input):
             """
@@ -75,28 +101,51 @@ class EchoState(AbstractModel):
             :param input: Input to the network.
             :return:
             """
-            x = np.array(input)
+            x = np.asarray(input, dtype=self.dtype)
 
-            # reservoir ESN assume (n_samples, n_features)
-            x = EchoState.library_esn.transform(x.reshape(-1, len(input))).flatten()  # we have only one sample
+            if not self.keep_echo:
+                self.reset()
+            x = self.reservoir.step(x, self.state, self.buffers, self.readout)
             for W in self.matrices:
-                x = np.concatenate((x, [1]), axis=0)
-                x = self.activation(np.matmul(x, W))
+                x = np.concatenate((x, self.bias), axis=0)
+                x = np.matmul(x, W)
+                x = self.activation(x, out=x)
 
-            x = self.normalize(x)
-            return x
+            return self.normalize(x, out=x)
 
-        def normalize(self, x):
+        def reset(self):
+            """
+            Resets state of the reservoir (of all games) to the initial state.
             """
-            Normalizes the specified interval to [0, 1].
-            :param x: Values to be normalized.
-            :return: Normalized [0, 1] interval.
+            self.state.fill(0)
+            self.batch_states = None
+
+        def predict_batch(self, inputs, games=None):
             """
-            min_val = min(x)
-            max_val = max(x)
-            if max_val - min_val == 0:
-                return x
-            return np.array([((x_i - min_val) / (max_val - min_val)) for x_i in x])
+            Predicts outputs for a batch of inputs. Without 'keep_echo' (or games), every input is processed by the
+            reservoir independently from the initial state, same as in 'predict'. Otherwise, every game has its own
+            state of the reservoir (column of a state matrix) and all games are advanced by a single matrix product.
+            :param inputs: Inputs of shape (N, input size).
+            :param games: Index of the game of every input.
+            :return: Outputs of shape (N, output size).
+            """
+            if not self.keep_echo or games is None:
+                x = self.reservoir.transform_batch(np.asarray(inputs, dtype=self.dtype))
+            else:
+                games = np.asarray(games)
+                n_games = games.max() + 1 if len(games) > 0 else 0
+                if self.batch_states is None or self.batch_states.shape[1] < n_games:
+                    states = self.reservoir.new_state_batch(n_games)
+                    if self.batch_states is not None:
+                        states[:, :self.batch_states.shape[1]] = self.batch_states
+                    self.batch_states = states
+                x = self.reservoir.step_batch(inputs, self.batch_states, games)
+            for W in self.matrices:
+                x = np.matmul(x, W[:-1])  # the last row of W are biases
+                x += W[-1]
+                x = self.activation(x, out=x)
+
+            return self.normalize(x, out=x)
 
     def get_name(self):
         """
@@ -111,7 +160,8 @@ class EchoState(AbstractModel):
         return "EchoState"
 
     def __init__(self, n_readout, n_components, output_layers, activation, weights=None, game_config=None,
-                 echo_state_seed=None):
+                 echo_state_seed=None, layout=None, precision="float64", connectivity=None, input_connectivity=None,
+                 radius_estimator="arpack", keep_echo=False):
         """
         Initializes a new instance of Echo-State network model.
         :param n_readout: Number of readout neurons, chosen randomly in the reservoir.
@@ -121,6 +171,14 @@ class EchoState(AbstractModel):
         :param weights: Weights of output layers.
         :param game_config: Game configuration file.
         :param echo_state_seed: Seed for echo state network library.
+        :param layout: Precomputed layout of weights (see 'get_layout'), or None to compute it.
+        :param precision: Precision of weights, reservoir and computations ("float64" or "float32").
+        :param connectivity: Fraction of non-zero connections of a sparse reservoir, or None for a dense reservoir.
+        :param input_connectivity: Fraction of non-zero input weights of the reservoir, or None for dense input weights.
+        :param radius_estimator: Estimator of spectral radius of the reservoir ("exact", "arpack", "circular" or "auto",
+        see 'lib.simple_esn.spectral_radius').
+        :param keep_echo: If true, state of the reservoir is kept between steps of a game, otherwise every input is
+        processed from the initial state of the reservoir.
         """
         self.n_readout = n_readout
         self.n_components = n_components
@@ -128,47 +186,121 @@ class EchoState(AbstractModel):
         self.activation = activation
         self.weights = weights
         self.game_config = game_config
+        self.precision = precision
+        self.dtype = get_dtype(precision)
+        self.connectivity = connectivity
+        self.input_connectivity = input_connectivity
+        self.radius_estimator = radius_estimator
+        self.keep_echo = keep_echo
+        self.layouts = {}
 
-        if EchoState.library_esn == None or echo_state_seed != None:
+        # The reservoir is shared by the whole process (seed of the last model if not specified); the instance keeps
+        # the reservoir of its seed and settings, even if another model replaces the shared one later
+        with EchoState.state_check_lock:
             if echo_state_seed == None:
-                EchoState.echo_state_seed = np.random.randint(0, 2 ** 16)
-            else:
-                EchoState.echo_state_seed = echo_state_seed
-
-            EchoState.library_esn = lib.simple_esn.SimpleESN(n_readout, n_components,
-                                                             random_state=EchoState.echo_state_seed)
-
-        if not weights == None and not game_config == None:
-            # Init the network
-            phases = self.game_config["game_phases"]
-            self.models = []
-            used_weights = 0
-            output_layers = self.output_layers
-            for phase in range(phases):
-                input_size = self.game_config["input_sizes"][phase]
-                output_size = self.game_config["output_sizes"][phase]
-                layer_sizes = [n_readout] + output_layers + [output_size]
-
-                EchoState.state_check_lock.acquire()
-                if EchoState.library_esn.weights_ is None:
-                    EchoState.library_esn.init_weights(n_samples=1, n_features=input_size)
-                EchoState.state_check_lock.release()
-
-                if (phases == 1):
-                    self.models.append(self.EchoStateNetwork(layer_sizes, activation, weights))
+                if EchoState.library_esn == None:
+                    echo_state_seed = np.random.randint(0, 2 ** 16)
                 else:
-                    # slice all weights and use only reliable weights to the current phase
-                    new_used_weights = used_weights
-                    input_size = n_readout + 1  # bias
-                    if len(output_layers) == 0:
-                        new_used_weights += input_size * output_size
-                    else:
-                        new_used_weights += input_size * output_layers[0]
-                        for i in range(len(output_layers) - 1):
-                            new_used_weights += (output_layers[i] + 1) * output_layers[i + 1]
-                        new_used_weights += (output_layers[-1] + 1) * output_size
-                    self.models.append(self.EchoStateNetwork(layer_sizes, activation, weights))
-                    used_weights = new_used_weights
+                    echo_state_seed = EchoState.echo_state_seed
+            self.echo_state_seed = echo_state_seed
+            self.use_reservoir()
+
+        if weights is not None and game_config is not None:
+            # Networks of phases are created on their first use (see 'get_network')
+            self.layout = layout if layout is not None else self.get_layout(game_config)
+            self.flat_weights = None  # 'weights' converted on the first use (individuals are lists)
+            self.normalization = game_config.get("normalization", utils.normalizations.DEFAULT_NORMALIZATION)
+            self.models = [None] * self.layout.phases
+
+    def __getstate__(self):
+        """
+        Returns state of the model for pickling (e.g. sending to worker processes). The reservoir is shared by the
+        whole process, so only its seed is stored.
+        :return: State of the model.
+        """
+        state = self.__dict__.copy()
+        del state["reservoir"]
+        return state
+
+    def __setstate__(self, state):
+        """
+        Restores the model from pickled state; the reservoir of the current process is recreated if it differs.
+        :param state: State of the model (see '__getstate__').
+        """
+        self.__dict__.update(state)
+        with EchoState.state_check_lock:
+            self.use_reservoir()
+
+    def use_reservoir(self):
+        """
+        Sets the reservoir of the current model. The reservoir shared by the process is reused if it has the same seed
+        and settings, otherwise it is replaced by a new one (must be called with 'state_check_lock' locked).
+        """
+        if (EchoState.library_esn is None or EchoState.echo_state_seed != self.echo_state_seed or
+                any(getattr(EchoState.library_esn, name) != value
+                    for name, value in self.get_reservoir_settings().items())):
+            EchoState.echo_state_seed = self.echo_state_seed
+            EchoState.library_esn = self.create_reservoir()
+        self.reservoir = EchoState.library_esn
+
+    def get_reservoir_settings(self):
+        """
+        Returns settings of the reservoir of the current model (parameters of SimpleESN other than sizes and seed).
+        :return: Dictionary of settings.
+        """
+        return {"dtype": self.dtype, "connectivity": self.connectivity, "input_connectivity": self.input_connectivity,
+                "radius_estimator": self.radius_estimator}
+
+    def create_reservoir(self):
+        """
+        Creates reservoir (echo state network library) of the current model, using its seed.
+        :return: Instance of SimpleESN (weights are initialized on the first use).
+        """
+        return lib.simple_esn.SimpleESN(self.n_readout, self.n_components, random_state=self.echo_state_seed,
+                                        cache_dir=EchoState.reservoir_cache_dir,
+                                        cache_size=EchoState.reservoir_cache_size, **self.get_reservoir_settings())
+
+    def get_network(self, phase):
+        """
+        Returns network of the specified game phase (created on the first use and then cached in the instance).
+        :param phase: Game phase.
+        :return: Instance of EchoStateNetwork.
+        """
+        network = self.models[phase]
+        if network is None:
+            if self.flat_weights is None:
+                self.flat_weights = as_weights(self.weights, self.dtype)
+            input_size = self.game_config["input_sizes"][phase]
+
+            # The lock is needed only to initialize the shared reservoir, then the reservoir is read-only
+            with EchoState.state_check_lock:
+                if self.reservoir.weights_ is None:
+                    self.reservoir.init_weights(n_samples=1, n_features=input_size)
+
+            network = self.EchoStateNetwork(self.reservoir, self.layout.layer_sizes[phase], self.activation,
+                                            self.flat_weights, self.layout, phase, self.dtype, self.normalization,
+                                            self.keep_echo)
+            self.models[phase] = network
+        return network
+
+    def get_layout(self, game_config):
+        """
+        Returns layout of weights of output layers of all phases (computed only once for the game and reused by all
+        instances created by 'get_new_instance').
+        :param game_config: Game configuration file.
+        :return: Instance of LayerLayout.
+        """
+        key = tuple(game_config["output_sizes"])
+        layout = self.layouts.get(key)
+        if layout is None:
+            layer_sizes = [[self.n_readout] + self.output_layers + [output_size]
+                           for output_size in game_config["output_sizes"]]
+            # Networks of all phases read weights from the beginning of the weight vector (models were trained
+            # this way, although the weight vector has space for weights of every phase)
+            size = LayerLayout.sequential(layer_sizes).size
+            layout = LayerLayout(layer_sizes, [0] * len(layer_sizes), size)
+            self.layouts[key] = layout
+        return layout
 
     def get_new_instance(self, weights, game_config):
         """
@@ -178,7 +310,10 @@ class EchoState(AbstractModel):
         :return: a new instance of current model.
         """
         instance = EchoState(self.n_readout, self.n_components, self.output_layers, self.activation, weights,
-                             game_config)
+                             game_config, echo_state_seed=self.echo_state_seed, layout=self.get_layout(game_config),
+                             precision=self.precision, connectivity=self.connectivity,
+                             input_connectivity=self.input_connectivity,
+                             radius_estimator=self.radius_estimator, keep_echo=self.keep_echo)
         return instance
 
     def get_number_of_parameters(self, game):
@@ -187,19 +322,7 @@ class EchoState(AbstractModel):
         :return: Number of parameters of neural network (this will be equal to evolution individual length).
         """
         game_config = utils.miscellaneous.get_game_config(game)
-        total_weights = 0
-        learnable_layers = self.output_layers
-        for phase in range(game_config["game_phases"]):
-            input_size = self.n_readout + 1  # bias
-            output_size = game_config["output_sizes"][phase]
-            if len(learnable_layers) == 0:
-                total_weights += input_size * output_size
-            else:
-                total_weights += input_size * learnable_layers[0]
-                for i in range(len(learnable_layers) - 1):
-                    total_weights += (learnable_layers[i] + 1) * learnable_layers[i + 1]
-                total_weights += (learnable_layers[-1] + 1) * output_size
-        return total_weights
+        return self.get_layout(game_config).size
 
     def evaluate(self, input, current_phase):
         """
@@ -207,17 +330,38 @@ class EchoState(AbstractModel):
         :param input: Input from the game.
         :return: Output of the forward pass.
         """
-        return self.models[current_phase].predict(input)
+        return self.get_network(current_phase).predict(input)
+
+    def reset(self):
+        """
+        Resets state of reservoirs of networks of all phases before a new game.
+        """
+        for network in self.models:
+            if network is not None:
+                network.reset()
+
+    def evaluate_batch(self, states, phases, games=None):
+        """
+        Performs forward pass of a batch of states (one matrix product per layer and phase).
+        :param states: States of games (array of shape (N, input size) or a list of N states).
+        :param phases: Game phase of every state (list of N phases), or a single phase of all states.
+        :param games: Index of the game of every state, reservoir of every game keeps its state between steps (only
+        with 'keep_echo', until 'reset'), or None if states are independent.
+        :return: Outputs of the model, one per state (see 'AbstractModel.evaluate_batch').
+        """
+        if games is not None:
+            games = np.asarray(games)
+        return self.evaluate_grouped(states, phases, lambda x, phase, indices: self.get_network(phase).predict_batch(
+            x, games if games is None or indices is None else games[indices]))
 
     def to_string(self):
         """
         A string representation of the current object, that describes parameters.
         :return: A string representation of the current object.
         """
-        return "ESN - echo-state-size: {}, n_readouts: {}, output_layers: {}, activation: {}".format(self.n_components,
-                                                                                                     self.n_readout,
-                                                                                                     self.output_layers,
-                                                                                                     self.activation)
+        return "ESN - echo-state-size: {}, n_readouts: {}, output_layers: {}, activation: {}, precision: {}, " \
+               "connectivity: {}".format(self.n_components, self.n_readout, self.output_layers, self.activation,
+                                         self.precision, self.connectivity)
 
     def to_dictionary(self):
         """
@@ -229,5 +373,10 @@ class EchoState(AbstractModel):
         data["n_components"] = self.n_components
         data["output_layers"] = self.output_layers
         data["activation"] = self.activation
-        data["echo_state_seed"] = EchoState.echo_state_seed
+        data["echo_state_seed"] = self.echo_state_seed
+        data["precision"] = self.precision
+        data["connectivity"] = self.connectivity
+        data["input_connectivity"] = self.input_connectivity
+        data["radius_estimator"] = self.radius_estimator
+        data["keep_echo"] = self.keep_echo
         return data
@@ -0,0 +1,279 @@
+import time
+import numpy as np
+import constants
+from threading import Lock
+
+from models.abstract_model import AbstractModel
+
+
+class Expectimax(AbstractModel):
+    """
+    Represents a search-based (non-learning) model for the game 2048. Uses depth-limited expectimax search over the
+    bitboard engine of the game with pruning of unlikely chance nodes and a time budget per move (iterative
+    deepening). The search is vectorized: all boards of a level of the tree are expanded at once using NumPy lookup
+    tables of rows, and equal boards are evaluated only once. A search of depth 3 takes about 10 ms per move (depth 4
+    about 75 ms). Used as a strong baseline for comparison with learned models. Works with both raw and
+    one-hot state encoding of the game.
+    """
+    heuristic_lock = Lock()
+    tables = None  # lookup tables of rows shared by all instances (see 'build_tables')
+
+    # Weights of row heuristic (sum of rows and columns of the board)
+    LOST_PENALTY = 200000.0
+    MONOTONICITY_POWER = 4.0
+    MONOTONICITY_WEIGHT = 47.0
+    SUM_POWER = 3.5
+    SUM_WEIGHT = 11.0
+    MERGES_WEIGHT = 700.0
+    EMPTY_WEIGHT = 270.0
+
+    class Timeout(Exception):
+        """
+        Raised when the time budget of the current move is exhausted.
+        """
+        pass
+
+    def __init__(self, max_depth=3, time_budget=0.1, prob_threshold=0.0001):
+        """
+        Initializes a new instance of Expectimax model.
+        :param max_depth: Maximum search depth (number of player moves).
+        :param time_budget: Time budget per move in seconds (or None for no limit). Search is deepened iteratively
+        and the result of the deepest completed search is used.
+        :param prob_threshold: Chance nodes reached with lower probability are evaluated by the heuristic only.
+        """
+        self.max_depth = max_depth
+        self.time_budget = time_budget
+        self.prob_threshold = prob_threshold
+        # Imported here: game modules and 'utils.miscellaneous' import each other, so the latter must be imported first
+        import utils.miscellaneous
+        self.engine = utils.miscellaneous.get_game_class("2048").load_engine(constants.GAME2048_BITBOARD_PY_PATH)
+
+        with Expectimax.heuristic_lock:
+            if Expectimax.tables is None:
+                Expectimax.tables = Expectimax.build_tables(self.engine)
+
+        self.deadline = None
+        self.nodes = 0
+
+    @staticmethod
+    def build_row_heuristic():
+        """
+        Precomputes heuristic value of all 65,536 possible rows (rows of exponents).
+        :return: Heuristic lookup table.
+        """
+        table = [0.0] * 65536
+        for row in range(65536):
+            line = [(row >> (4 * i)) & 0xF for i in range(4)]
+            total = 0.0
+            empty = 0
+            merges = 0
+            prev = 0
+            counter = 0
+            for rank in line:
+                total += rank ** Expectimax.SUM_POWER
+                if rank == 0:
+                    empty += 1
+                else:
+                    if prev == rank:
+                        counter += 1
+                    elif counter > 0:
+                        merges += 1 + counter
+                        counter = 0
+                    prev = rank
+            if counter > 0:
+                merges += 1 + counter
+
+            monotonicity_left = 0.0
+            monotonicity_right = 0.0
+            for i in range(1, 4):
+                a = line[i - 1] ** Expectimax.MONOTONICITY_POWER
+                b = line[i] ** Expectimax.MONOTONICITY_POWER
+                if line[i - 1] > line[i]:
+                    monotonicity_left += a - b
+                else:
+                    monotonicity_right += b - a
+
+            table[row] = (Expectimax.LOST_PENALTY + Expectimax.EMPTY_WEIGHT * empty +
+                          Expectimax.MERGES_WEIGHT * merges -
+                          Expectimax.MONOTONICITY_WEIGHT * min(monotonicity_left, monotonicity_right) -
+                          Expectimax.SUM_WEIGHT * total)
+        return table
+
+    @staticmethod
+    def build_tables(engine):
+        """
+        Converts lookup tables of the bitboard engine to NumPy arrays (indexed by arrays of rows).
+        :param engine: Bitboard engine of the game.
+        :return: Dictionary of tables.
+        """
+        return {"row_left": np.array(engine.ROW_LEFT, dtype=np.uint64),
+                "row_right": np.array(engine.ROW_RIGHT, dtype=np.uint64),
+                "reward_left": np.array(engine.REWARD_LEFT, dtype=np.float64),
+                "reward_right": np.array(engine.REWARD_RIGHT, dtype=np.float64),
+                "heuristic": np.array(Expectimax.build_row_heuristic(), dtype=np.float64)}
+
+    def heuristic(self, boards):
+        """
+        Heuristic values of boards (sum of heuristic values of their rows and columns).
+        :param boards: Array of boards (uint64).
+        :return: Array of values.
+        """
+        table = Expectimax.tables["heuristic"]
+        value = np.zeros(len(boards))
+        for b in (boards, self.engine.transpose(boards)):
+            for shift in (0, 16, 32, 48):
+                value += table[(b >> shift) & 0xFFFF]
+        return value
+
+    def push_rows(self, boards, direction):
+        """
+        Pushes all rows of boards to the left (direction 0) or right (direction 2).
+        :return: Pushed boards, rewards of pushes.
+        """
+        side = "right" if direction & 2 else "left"
+        row_table = Expectimax.tables["row_" + side]
+        reward_table = Expectimax.tables["reward_" + side]
+        pushed = np.zeros_like(boards)
+        reward = np.zeros(len(boards))
+        for shift in (0, 16, 32, 48):
+            rows = (boards >> shift) & 0xFFFF
+            pushed |= row_table[rows] << shift
+            reward += reward_table[rows]
+        return pushed, reward
+
+    def push(self, boards):
+        """
+        Pushes boards in all four directions (0 = left, 1 = up, 2 = right, 3 = down).
+        :param boards: Array of boards (uint64).
+        :return: Pushed boards and rewards, arrays of shape (4, number of boards).
+        """
+        transposed = self.engine.transpose(boards)
+        pushed = np.empty((4, len(boards)), dtype=np.uint64)
+        rewards = np.empty((4, len(boards)))
+        for direction in range(4):
+            if direction & 1:
+                b, rewards[direction] = self.push_rows(transposed, direction)
+                pushed[direction] = self.engine.transpose(b)
+            else:
+                pushed[direction], rewards[direction] = self.push_rows(boards, direction)
+        return pushed, rewards
+
+    def chance_nodes(self, boards, depth, probs):
+        """
+        Expected values of boards where a new tile is going to be spawned. All boards of a level of the search tree
+        are expanded at once; equal boards of the next level are evaluated only once (transposition).
+        :param boards: Array of distinct boards (uint64).
+        :param depth: Remaining depth (number of player moves).
+        :param probs: Probability of reaching every board.
+        :return: Array of values.
+        """
+        if depth <= 0:
+            return self.heuristic(boards)
+        if self.deadline is not None and time.time() > self.deadline:
+            raise Expectimax.Timeout()
+
+        values = np.empty(len(boards))
+        leaf = probs < self.prob_threshold
+        values[leaf] = self.heuristic(boards[leaf])
+        expand = np.flatnonzero(~leaf)
+        if len(expand) == 0:
+            return values
+        boards = boards[expand]
+        probs = probs[expand]
+
+        # Children: a new tile (2 with probability 0.9, 4 with 0.1) on every empty cell
+        nibbles = (boards[:, None] >> self.engine.NIBBLE_SHIFTS) & 0xF
+        parents, cells = np.nonzero(nibbles == 0)
+        counts = np.bincount(parents, minlength=len(boards))
+        tiles = np.uint64(1) << (cells.astype(np.uint64) * np.uint64(4))
+        children = np.concatenate((boards[parents] | tiles, boards[parents] | (tiles << np.uint64(1))))
+        weights = np.concatenate((np.full(len(parents), 0.9), np.full(len(parents), 0.1))) / \
+            np.tile(counts[parents], 2)
+        parents = np.tile(parents, 2)
+        self.nodes += len(children)
+
+        # Player moves of the children, values of distinct legal results
+        pushed, _ = self.push(children)
+        legal = pushed != children
+        candidates = pushed[legal]
+        unique, inverse = np.unique(candidates, return_inverse=True)
+        unique_probs = np.zeros(len(unique))
+        np.maximum.at(unique_probs, inverse, np.broadcast_to(probs[parents] * weights, pushed.shape)[legal])
+        moves = np.full(pushed.shape, -np.inf)
+        moves[legal] = self.chance_nodes(unique, depth - 1, unique_probs)[inverse]
+        best = moves.max(axis=0)
+        best[~legal.any(axis=0)] = 0.0  # lost game
+
+        values[expand] = np.bincount(parents, weights=weights * best, minlength=len(boards))
+        return values
+
+    def search(self, board, depth):
+        """
+        Evaluates all moves from the specified board using search of the specified depth.
+        :return: Values of moves (-inf for illegal moves).
+        """
+        boards = np.array([board], dtype=np.uint64)
+        pushed, rewards = self.push(boards)
+        pushed, rewards = pushed[:, 0], rewards[:, 0]
+        values = np.full(4, -np.inf)
+        legal = np.flatnonzero(pushed != board)
+        if len(legal) > 0:
+            unique, inverse = np.unique(pushed[legal], return_inverse=True)
+            values[legal] = rewards[legal] + self.chance_nodes(unique, depth, np.ones(len(unique)))[inverse]
+        return values
+
+    def get_exponents(self, input):
+        """
+        Decodes exponents of tiles from the state of the game (raw or one-hot encoding).
+        """
+        x = np.asarray(input).reshape(16, -1)
+        if x.shape[1] == 1:
+            return x[:, 0]
+        return np.where(x.any(axis=1), np.argmax(x, axis=1) + 1, 0)
+
+    def evaluate(self, input, current_phase):
+        """
+        Evaluates all moves of the current game state. Best move has the highest value.
+        :param input: State of the game (raw or one-hot encoding).
+        :param current_phase: Current game phase - there's no any usage of this.
+        :return: Values of all four moves (-inf for illegal moves).
+        """
+        board = 0
+        for i, exponent in enumerate(self.get_exponents(input)):
+            board |= int(exponent) << (4 * i)
+
+        start = time.time()
+        self.nodes = 0
+        self.deadline = None
+
+        # The shallowest search is always completed, deeper ones only within the time budget
+        values = self.search(board, 1)
+        if self.time_budget is not None:
+            self.deadline = start + self.time_budget
+        for depth in range(2, self.max_depth + 1):
+            try:
+                values = self.search(board, depth)
+            except Expectimax.Timeout:
+                break
+        return values
+
+    def get_name(self):
+        """
+        A name of the current model.
+        """
+        return "expectimax"
+
+    def get_class_name(self):
+        """
+        A class name of the current model.
+        """
+        return "Expectimax"
+
+    def to_string(self):
+        """
+        A string representation of the current object, that describes parameters.
+        :return: A string representation of the current object.
+        """
+        return "Expectimax - max_depth: {}, time_budget: {}, prob_threshold: {}".format(self.max_depth,
+                                                                                       self.time_budget,
+                                                                                       self.prob_threshold)
@@ -0,0 +1,91 @@
+import numpy as np
+
+# Precisions of models (used for weights, reservoirs and all computations of a model)
+PRECISIONS = {"float64": np.float64, "float32": np.float32}
+
+
+def get_dtype(precision):
+    """
+    Returns NumPy type of the specified precision ("float64" or "float32").
+    """
+    if precision not in PRECISIONS:
+        raise NotImplementedError
+    return PRECISIONS[precision]
+
+
+def as_weights(weights, dtype=np.float64):
+    """
+    Returns weights as a flat float array. NumPy arrays of the specified type and buffers of it (e.g. memoryview,
+    raw byte buffers are interpreted as weights of the specified type) are used directly, without any copy; other
+    sequences (e.g. individuals of Deap library, which are lists) are converted by a single NumPy call.
+    :param weights: Weights (array, buffer or sequence of floats).
+    :param dtype: Type of the result (float64 or float32).
+    :return: Flat float array.
+    """
+    if isinstance(weights, memoryview):
+        if weights.format in ("B", "b", "c"):
+            return np.frombuffer(weights, dtype=dtype)  # raw bytes (e.g. shared memory) holding weights of the type
+        weights = np.asarray(weights)  # view of a typed buffer
+    if isinstance(weights, np.ndarray):
+        return weights.astype(dtype, copy=False).reshape(-1)
+    return np.array(weights, dtype=dtype)
+
+
+class LayerLayout():
+    """
+    Describes where the weight matrices of fully connected layers (networks of all game phases) are stored in the flat
+    weight vector of an individual. Layout is computed once per model and game, every new instance of the model
+    then only creates views into its weight vector.
+    """
+
+    @staticmethod
+    def sequential(layer_sizes):
+        """
+        Creates layout where weights of phases follow each other.
+        :param layer_sizes: Sizes of layers of the network of every phase (list of lists).
+        :return: Instance of LayerLayout.
+        """
+        offsets = []
+        offset = 0
+        for sizes in layer_sizes:
+            offsets.append(offset)
+            offset += sum((sizes[i] + 1) * sizes[i + 1] for i in range(len(sizes) - 1))
+        return LayerLayout(layer_sizes, offsets)
+
+    def __init__(self, layer_sizes, offsets, size=None):
+        """
+        Initializes a new instance of LayerLayout.
+        :param layer_sizes: Sizes of layers of the network of every phase (list of lists).
+        :param offsets: Offset of weights of every phase in the weight vector.
+        :param size: Length of the weight vector, or None if it ends with the last weight used.
+        """
+        self.layer_sizes = layer_sizes
+        self.offsets = offsets
+
+        # For every phase, list of (start, end, shape) of every matrix; the last row of a matrix are biases
+        self.slices = []
+        self.size = 0
+        for sizes, offset in zip(layer_sizes, offsets):
+            phase_slices = []
+            for i in range(len(sizes) - 1):
+                m = sizes[i] + 1
+                n = sizes[i + 1]
+                phase_slices.append((offset, offset + m * n, (m, n)))
+                offset += m * n
+            self.slices.append(phase_slices)
+            self.size = max(self.size, offset)
+        if size is not None:
+            self.size = max(self.size, size)
+
+    @property
+    def phases(self):
+        return len(self.layer_sizes)
+
+    def get_matrices(self, weights, phase):
+        """
+        Returns weight matrices of the specified phase, as views into the weight vector (no copy is made).
+        :param weights: Flat float array of weights (see 'as_weights').
+        :param phase: Game phase.
+        :return: List of matrices of shape (layer input + 1, layer output).
+        """
+        return [weights[start:end].reshape(shape) for start, end, shape in self.slices[phase]]
@@ -1,9 +1,9 @@
 import numpy as np
-import constants
 import json
 import utils.miscellaneous
 from models.abstract_model import AbstractModel
-from utils import activations
+from models.layer_layout import LayerLayout, as_weights, get_dtype
+from utils import activations, normalizations
 
 
 class MLP(AbstractModel):
@@ -25,6 +25,7 @@ class MLP(AbstractModel):
                 data = json.load(f)
 
             weights = data["weights"]
+            precision = "float64"
             if "hidden_sizes" and "activation" in data:
                 # old format
                 hidden = list(map(int, data["hidden_sizes"]))
@@ -33,32 +34,42 @@ class MLP(AbstractModel):
                 # new format
                 hidden = list(map(int, data["model"]["hidden_layers"]))
                 activation = data["model"]["activation"]
+                precision = data["model"].get("precision", precision)
         except:
             raise ValueError("File has wrong format.")
 
         game_config = utils.miscellaneous.get_game_config(game)
         print("Loading MLP model from file {}".format(file_name))
-        return MLP(hidden_layers=hidden, activation=activation, weights=weights, game_config=game_config)
+        return MLP(hidden_layers=hidden, activation=activation, weights=weights, game_config=game_config,
+                   precision=precision)
 
     class MLPNetwork():
         """
         Represents MLP network model (internally). Single Network.
         """
-        def __init__(self, layer_sizes, activation, weights):
+        def __init__(self, layer_sizes, activation, weights, layout=None, phase=0, dtype=np.float64,
+                     normalization=normalizations.DEFAULT_NORMALIZATION):
+            """
+            Initializes a new instance of MLPNetwork.
+            :param layer_sizes: Sizes of layers.
+            :param activation: Activation function.
+            :param weights: Weights (flat float array, buffer or list, see 'as_weights').
+            :param layout: Layout of weights (or None if weights contain only this network).
+            :param phase: Game phase of the network in the layout.
+            :param dtype: Type of weights and computations (float64 or float32).
+            :param normalization: Normalization of outputs (see 'utils.normalizations').
+            """
             self.layer_sizes = layer_sizes
             self.activation = activations.get_activation(activation)
-            self.weights = weights
+            self.normalize = normalizations.get_normalization(normalization)
+            self.dtype = dtype
+            self.bias = np.ones(1, dtype=dtype)
+            self.weights = as_weights(weights, dtype)
+            if layout is None:
+                layout = LayerLayout.sequential([layer_sizes])
 
-            weights = np.array(list(map(float, self.weights)))
-            l_bound = 0
-            r_bound = 0
-            self.matrices = []
-            for i in range(len(self.layer_sizes) - 1):
-                m = self.layer_sizes[i] + 1
-                n = self.layer_sizes[i + 1]
-                r_bound += m * n
-                self.matrices.append(weights[l_bound:r_bound:1].reshape(m, n))
-                l_bound = r_bound
+            # Matrices are views into the weight vector (no copy)
+            self.matrices = layout.get_matrices(self.weights, phase)
 
         def predict(self, input):
             """
@@ -66,25 +77,71 @@ class MLP(AbstractModel):
             :param input: Input to the neural network.
             :return: Output of the neural network.
             """
-            x = np.array(input)
+            x = np.asarray(input, dtype=self.dtype)
+            for W in self.matrices:
+                x = np.concatenate((x, self.bias), axis=0)
+                x = np.matmul(x, W)
+                x = self.activation(x, out=x)
+
+            return self.normalize(x, out=x)
+
+        def predict_batch(self, inputs):
+            """
+            Performs forward pass of a batch of inputs in the current network instance.
+            :param inputs: Inputs of shape (N, input size).
+            :return: Outputs of shape (N, output size).
+            """
+            x = np.array(inputs, dtype=self.dtype)
             for W in self.matrices:
-                x = np.concatenate((x, [1]), axis=0)
-                x = self.activation(np.matmul(x, W))
+                x = np.matmul(x, W[:-1])  # the last row of W are biases
+                x += W[-1]
+                x = self.activation(x, out=x)
+
+            return self.normalize(x, out=x)
+
+    class MLPPopulation():
+        """
+        Represents MLP networks of all individuals of a population. Weights of every layer are stacked into a single
+        tensor of shape (individuals, layer input + 1, layer output), so a forward pass of all individuals is a single
+        batched matrix product per layer.
+        """
+
+        def __init__(self, layout, activation, population, dtype=np.float64,
+                     normalization=normalizations.DEFAULT_NORMALIZATION):
+            """
+            Initializes a new instance of MLPPopulation.
+            :param layout: Layout of weights of an individual (see 'MLP.get_layout').
+            :param activation: Activation function.
+            :param population: Weights of all individuals (list of individuals or 2D array).
+            :param dtype: Type of weights and computations (float64 or float32).
+            :param normalization: Normalization of outputs (see 'utils.normalizations').
+            """
+            self.layout = layout
+            self.activation = activations.get_activation(activation)
+            self.normalize = normalizations.get_normalization(normalization)
+            self.dtype = dtype
+            weights = np.array(population, dtype=dtype)
+            self.size = weights.shape[0]
 
-            x = self.normalize(x)
-            return x
+            self.matrices = []
+            for phase_slices in layout.slices:
+                self.matrices.append([weights[:, start:end].reshape((self.size,) + shape)
+                                      for start, end, shape in phase_slices])
 
-        def normalize(self, x):
+        def predict(self, inputs, phase):
             """
-            Normalizes the specified interval to [0, 1].
-            :param x: Values to be normalized.
-            :return: Normalized [0, 1] interval.
+            Performs forward pass of all individuals.
+            :param inputs: Inputs of shape (individuals, N, input size), N inputs of every individual.
+            :param phase: Game phase of all inputs.
+            :return: Outputs of shape (individuals, N, output size).
             """
-            min_val = min(x)
-            max_val = max(x)
-            if max_val - min_val == 0:
-                return x
-            return np.array([((x_i - min_val) / (max_val - min_val)) for x_i in x])
+            x = np.array(inputs, dtype=self.dtype)
+            for W in self.matrices[phase]:
+                x = np.matmul(x, W[:, :-1, :])  # the last row of W are biases
+                x += W[:, -1:, :]
+                x = self.activation(x, out=x)
+
+            return self.normalize(x, out=x)
 
     def get_name(self):
         """
@@ -98,7 +155,7 @@ class MLP(AbstractModel):
         """
         return "MLP"
 
-    def __init__(self, hidden_layers, activation, weights=None, game_config=None):
+    def __init__(self, hidden_layers, activation, weights=None, game_config=None, layout=None, precision="float64"):
         """
         Initializes a new instance of SimpleNN.
         :param hidden_layers: list of sizes of hidden layers.
@@ -109,36 +166,67 @@ class MLP(AbstractModel):
         2) output size (number of "actuators" = number of AI outputs)
         3) number of game phases in total
         (This parameter is dictionary [json]).
+        :param layout: Precomputed layout of weights (see 'get_layout'), or None to compute it.
+        :param precision: Precision of weights and computations ("float64" or "float32").
         """
         self.hidden_layers = hidden_layers
         self.activation = activation
         self.weights = weights
         self.game_config = game_config
+        self.precision = precision
+        self.dtype = get_dtype(precision)
+        self.layouts = {}
+
+        if weights is not None and game_config is not None:
+            # Networks of phases are created on their first use (see 'get_network')
+            self.layout = layout if layout is not None else self.get_layout(game_config)
+            self.flat_weights = None  # 'weights' converted on the first use (individuals are lists)
+            self.normalization = game_config.get("normalization", normalizations.DEFAULT_NORMALIZATION)
+            self.models = [None] * self.layout.phases
+
+    def get_network(self, phase):
+        """
+        Returns network of the specified game phase (created on the first use and then cached in the instance).
+        :param phase: Game phase.
+        :return: Instance of MLPNetwork.
+        """
+        network = self.models[phase]
+        if network is None:
+            if self.flat_weights is None:
+                self.flat_weights = as_weights(self.weights, self.dtype)
+            network = self.MLPNetwork(self.layout.layer_sizes[phase], self.activation, self.flat_weights, self.layout,
+                                      phase, self.dtype, self.normalization)
+            self.models[phase] = network
+        return network
+
+    def get_layout(self, game_config):
+        """
+        Returns layout of weights of networks of all phases (computed only once for the game and reused by all
+        instances created by 'get_new_instance'). Weights of phases follow each other.
+        :param game_config: Game configuration file.
+        :return: Instance of LayerLayout.
+        """
+        key = (tuple(game_config["input_sizes"]), tuple(game_config["output_sizes"]))
+        layout = self.layouts.get(key)
+        if layout is None:
+            layer_sizes = []
+            for phase in range(game_config["game_phases"]):
+                input_size = game_config["input_sizes"][phase]
+                output_size = game_config["output_sizes"][phase]
+                layer_sizes.append([input_size] + self.hidden_layers + [output_size])
+            layout = LayerLayout.sequential(layer_sizes)
+            self.layouts[key] = layout
+        return layout
 
-        if not weights == None and not game_config == None:
-            # Init the network
-            phases = self.game_config["game_phases"]
-            self.models = []
-            used_weights = 0
-            hidden_layers = self.hidden_layers
-            for phase in range(phases):
-                input_size = self.game_config["input_sizes"][phase]
-                output_size = self.game_config["output_sizes"][phase]
-                layer_sizes = [input_size] + hidden_layers + [output_size]
-                if (phases == 1):
-                    self.models.append(self.MLPNetwork(layer_sizes, self.activation, self.weights))
-                else:
-                    # slice all weights and use only reliable weights to the current phase
-                    new_used_weights = used_weights
-                    input_size = input_size + 1  # bias
-                    new_used_weights += input_size * hidden_layers[0]
-                    for i in range(len(hidden_layers) - 1):
-                        new_used_weights += (hidden_layers[i] + 1) * hidden_layers[i + 1]
-                    new_used_weights += (hidden_layers[-1] + 1) * output_size
-                    self.models.append(self.MLPNetwork(layer_sizes=layer_sizes,
-                                                       activation=self.activation,
-                                                       weights=self.weights[used_weights:new_used_weights]))
-                    used_weights = new_used_weights
+    def get_population_instance(self, population, game_config):
+        """
+        Creates a model evaluating networks of all individuals of the population at once.
+        :param population: Weights of all individuals.
+        :param game_config: Game configuration file.
+        :return: Instance of MLPPopulation.
+        """
+        normalization = game_config.get("normalization", normalizations.DEFAULT_NORMALIZATION)
+        return self.MLPPopulation(self.get_layout(game_config), self.activation, population, self.dtype, normalization)
 
     def get_new_instance(self, weights, game_config):
         """
@@ -147,7 +235,8 @@ class MLP(AbstractModel):
         :param game_config: Game configuration file.
         :return: newly created instance of MLP.
         """
-        instance = MLP(self.hidden_layers, self.activation, weights, game_config)
+        instance = MLP(self.hidden_layers, self.activation, weights, game_config, self.get_layout(game_config),
+                       self.precision)
         return instance
 
     def get_number_of_parameters(self, game):
@@ -156,17 +245,7 @@ class MLP(AbstractModel):
         :return: Number of parameters of neural network (this will be equal to evolution individual length).
         """
         game_config = utils.miscellaneous.get_game_config(game)
-        total_weights = 0
-        h_sizes = self.hidden_layers
-        for phase in range(game_config["game_phases"]):
-            input_size = game_config["input_sizes"][phase] + 1
-            output_size = game_config["output_sizes"][phase]
-            total_weights += input_size * h_sizes[0]
-            if (len(h_sizes) > 1):
-                for i in range(len(h_sizes) - 1):
-                    total_weights += (h_sizes[i] + 1) * h_sizes[i + 1]
-            total_weights += (h_sizes[-1] + 1) * output_size
-        return total_weights
+        return self.get_layout(game_config).size
 
     def evaluate(self, input, current_phase):
         """
@@ -175,14 +254,26 @@ class MLP(AbstractModel):
         :param weights: Weights for the network (individual from evolution).
         :return: Output of the forward pass.
         """
-        return self.models[current_phase].predict(input)
+        return self.get_network(current_phase).predict(input)
+
+    def evaluate_batch(self, states, phases, games=None):
+        """
+        Performs forward pass of a batch of states (one matrix product per layer and phase).
+        :param states: States of games (array of shape (N, input size) or a list of N states).
+        :param phases: Game phase of every state (list of N phases), or a single phase of all states.
+        :param games: Index of the game of every state (not used, MLP has no state).
+        :return: Outputs of the model, one per state (see 'AbstractModel.evaluate_batch').
+        """
+        return self.evaluate_grouped(states, phases,
+                                     lambda x, phase, indices: self.get_network(phase).predict_batch(x))
 
     def to_string(self):
         """
         A string representation of the current object, that describes parameters.
         :return: A string representation of the current object.
         """
-        return "MLP - layers: {}, activation: {}".format(self.hidden_layers, self.activation)
+        return "MLP - layers: {}, activation: {}, precision: {}".format(self.hidden_layers, self.activation,
+                                                                        self.precision)
 
     def to_dictionary(self):
         """
@@ -192,4 +283,5 @@ class MLP(AbstractModel):
         data = {}
         data["hidden_layers"] = self.hidden_layers
         data["activation"] = self.activation
+        data["precision"] = self.precision
         return data
@@ -1,34 +1,78 @@
+"""
+Activation functions of models. NumPy kernels work element-wise on arrays of any shape (single vectors as well as
+(batch, features) matrices) and can work in place: every kernel has signature f(x, out=None) and writes into 'out'
+if it is given (use out=x to overwrite the input). Every activation is registered under a single name together with
+its TensorFlow counterpart (if any), so models of both kinds use the same names.
+"""
+from functools import partial
+
 import numpy as np
 import tensorflow as tf
 
+from utils.registry import Registry
+
+LEAKY_RELU_SLOPE = 0.01
+
+# Registry of activations: name -> (NumPy kernel, TensorFlow activation or None)
+activations = Registry("activation")
 
-def get_activation(name):
-    if name == "relu":
-        return relu
-    if name == "tanh":
-        return tanh
-    if name == "logsig":
-        return logsig
 
-    raise NotImplementedError
+def register_activation(name, kernel, tf_activation=None):
+    """
+    Registers a new activation function (or replaces an existing one).
+    :param name: Name of the activation (used in model settings).
+    :param kernel: NumPy kernel with signature f(x, out=None).
+    :param tf_activation: TensorFlow activation (function of a tensor), or None if not available.
+    """
+    activations.register(name, (kernel, tf_activation))
+
+
+def get_activation(name):
+    return activations.get(name)[0]
 
 
 def get_activation_tf(name):
-    if name == "relu":
-        return tf.nn.relu
-    if name == "tanh":
-        return tf.nn.tanh
-    if name == "identity":
-        return tf.identity
+    tf_activation = activations.get(name)[1]
+    if tf_activation is None:
+        raise ValueError("Activation is not available in TensorFlow: {}".format(name))
+    return tf_activation
+
+
+def relu(x, out=None):
+    return np.maximum(x, 0, out=out)
+
+
+def leaky_relu(x, out=None):
+    return np.maximum(x, LEAKY_RELU_SLOPE * x, out=out)
+
+
+def tanh(x, out=None):
+    return np.tanh(x, out=out)
+
+
+def logsig(x, out=None):
+    out = np.negative(x, out=out)
+    np.exp(out, out=out)
+    out += 1
+    return np.reciprocal(out, out=out)
 
 
-def relu(x):
-    return np.array([max(0, y) for y in x])
+def softsign(x, out=None):
+    denominator = np.abs(x)
+    denominator += 1
+    return np.divide(x, denominator, out=out)
 
 
-def tanh(x):
-    return np.array([np.tanh(y) for y in x])
+def identity(x, out=None):
+    if out is None or out is x:
+        return x
+    np.copyto(out, x)
+    return out
 
 
-def logsig(x):
-    return np.array([1 / (1 + np.exp(-y)) for y in x])
+register_activation("relu", relu, tf.nn.relu)
+register_activation("leaky_relu", leaky_relu, partial(tf.nn.leaky_relu, alpha=LEAKY_RELU_SLOPE))
+register_activation("tanh", tanh, tf.nn.tanh)
+register_activation("logsig", logsig, tf.nn.sigmoid)
+register_activation("softsign", softsign, tf.nn.softsign)
+register_activation("identity", identity, tf.identity)
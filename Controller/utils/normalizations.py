@@ -0,0 +1,52 @@
+"""
+Normalizations of model outputs, applied along the last axis (a single output vector or a batch of outputs). Kernels
+share the signature of activation kernels (see 'utils.activations'). The normalization of a game is selected by the
+'normalization' key of its configuration file ("minmax" if missing).
+"""
+import numpy as np
+
+from utils.activations import identity
+from utils.registry import Registry
+
+DEFAULT_NORMALIZATION = "minmax"
+
+# Registry of normalizations: name -> NumPy kernel
+normalizations = Registry("normalization")
+
+
+def register_normalization(name, kernel):
+    """
+    Registers a new normalization (or replaces an existing one).
+    :param name: Name of the normalization (used in game configuration files).
+    :param kernel: NumPy kernel with signature f(x, out=None).
+    """
+    normalizations.register(name, kernel)
+
+
+def get_normalization(name):
+    return normalizations.get(name)
+
+
+def minmax(x, out=None):
+    """
+    Rescales values along the last axis to [0, 1]. Constant vectors are left as they are.
+    """
+    min_val = x.min(axis=-1, keepdims=True)
+    span = x.max(axis=-1, keepdims=True)
+    span -= min_val
+    constant = span == 0
+    min_val[constant] = 0
+    span[constant] = 1
+    out = np.subtract(x, min_val, out=out)
+    return np.divide(out, span, out=out)
+
+
+def softmax(x, out=None):
+    out = np.subtract(x, x.max(axis=-1, keepdims=True), out=out)
+    np.exp(out, out=out)
+    return np.divide(out, out.sum(axis=-1, keepdims=True), out=out)
+
+
+register_normalization("minmax", minmax)
+register_normalization("softmax", softmax)
+register_normalization("none", identity)  # values are left as they are (for games that only rank the outputs)
@@ -0,0 +1,28 @@
+class Registry():
+    """
+    Named implementations (e.g. activations) selected by names in model settings or game configuration files.
+    """
+
+    def __init__(self, kind):
+        """
+        Initializes a new instance of Registry.
+        :param kind: What is registered (used in error messages).
+        """
+        self.kind = kind
+        self.items = {}
+
+    def register(self, name, item):
+        """
+        Registers a new item (or replaces an existing one).
+        :param name: Name of the item.
+        :param item: The item.
+        """
+        self.items[name] = item
+
+    def get(self, name):
+        if name not in self.items:
+            raise ValueError("Unknown {}: {}".format(self.kind, name))
+        return self.items[name]
+
+    def __contains__(self, name):
+        return name in self.items
@@ -0,0 +1,186 @@
+"""
+Streaming statistics of played games. Statistics are updated after every finished game (games themselves don't need
+to be kept) and they can be merged, so statistics collected by several workers can be combined into a single report.
+"""
+import math
+import os
+
+
+class RunningMoments:
+    """
+    Running count, mean and variance of values (Welford's algorithm; merging by Chan et al.).
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0  # sum of squared differences from the mean
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    def merge(self, other):
+        """
+        Adds values of other instance to this one.
+        :param other: Instance of RunningMoments.
+        """
+        count = self.count + other.count
+        if count == 0:
+            return
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+
+    @property
+    def variance(self):
+        return self.m2 / self.count if self.count > 0 else 0.0
+
+    @property
+    def std(self):
+        return math.sqrt(self.variance)
+
+
+class QuantileSketch:
+    """
+    Sketch of a distribution of non-negative values, used to estimate quantiles. Values are counted in logarithmic
+    buckets, so every estimated quantile is within the specified relative error of an actual value (DDSketch, Masson
+    et al., 2019). Memory depends only on the range of values, not on their count.
+    """
+
+    def __init__(self, relative_accuracy=0.01):
+        """
+        Initializes a new empty sketch.
+        :param relative_accuracy: Relative error of estimated quantiles.
+        """
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.buckets = {}
+        self.zeros = 0
+        self.count = 0
+
+    def add(self, value):
+        self.count += 1
+        if value <= 0:
+            self.zeros += 1
+        else:
+            index = int(math.ceil(math.log(value) / self.log_gamma))
+            self.buckets[index] = self.buckets.get(index, 0) + 1
+
+    def merge(self, other):
+        """
+        Adds values of other sketch (with the same relative accuracy) to this one.
+        :param other: Instance of QuantileSketch.
+        """
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Only sketches with the same relative accuracy can be merged.")
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.zeros += other.zeros
+        self.count += other.count
+
+    def quantile(self, q):
+        """
+        Estimates the specified quantile.
+        :param q: Quantile (between 0 and 1).
+        :return: Estimated value (None if the sketch is empty).
+        """
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zeros
+        if rank < seen:
+            return 0.0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if rank < seen:
+                return 2 * self.gamma ** index / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.buckets) / (self.gamma + 1)
+
+
+class GameStatistics:
+    """
+    Statistics of finished games: histogram of reached (max) tiles, moments and quantiles of scores and moments
+    of numbers of moves.
+    """
+    QUANTILES = [0.05, 0.25, 0.5, 0.75, 0.95]
+
+    def __init__(self, relative_accuracy=0.01):
+        """
+        Initializes new empty statistics.
+        :param relative_accuracy: Relative error of estimated quantiles of scores.
+        """
+        self.tiles = {}
+        self.score = RunningMoments()
+        self.score_sketch = QuantileSketch(relative_accuracy)
+        self.moves = RunningMoments()
+        self.max_score = None
+
+    @property
+    def count(self):
+        return self.score.count
+
+    def add(self, max_tile, score, moves):
+        """
+        Adds a finished game.
+        :param max_tile: The largest tile reached.
+        :param score: Final score of the game.
+        :param moves: Number of moves of the game.
+        """
+        max_tile, score, moves = int(max_tile), int(score), int(moves)
+        self.tiles[max_tile] = self.tiles.get(max_tile, 0) + 1
+        self.score.add(score)
+        self.score_sketch.add(score)
+        self.moves.add(moves)
+        self.max_score = score if self.max_score is None else max(self.max_score, score)
+
+    def merge(self, other):
+        """
+        Adds games of other statistics (e.g. collected by other worker) to this one.
+        :param other: Instance of GameStatistics.
+        """
+        for tile, count in other.tiles.items():
+            self.tiles[tile] = self.tiles.get(tile, 0) + count
+        self.score.merge(other.score)
+        self.score_sketch.merge(other.score_sketch)
+        self.moves.merge(other.moves)
+        if other.max_score is not None:
+            self.max_score = other.max_score if self.max_score is None else max(self.max_score, other.max_score)
+
+    def get_report(self, title, model_name, total=None):
+        """
+        Creates a text report of the statistics.
+        :param title: Title of the report.
+        :param model_name: Name of the model that played the games.
+        :param total: Number of games to be played in total (for partial reports), or None.
+        :return: Lines of the report.
+        """
+        games = "{}".format(self.count) if total is None or total == self.count else "{}/{}".format(self.count, total)
+        quantiles = ["{}%: {:.0f}".format(int(100 * q), self.score_sketch.quantile(q))
+                     for q in GameStatistics.QUANTILES if self.count > 0]
+        lines = [title,
+                 "Model: {}".format(model_name),
+                 "Total games: {}, Average score: {}, Average moves: {}".format(games, self.score.mean,
+                                                                                self.moves.mean),
+                 "Score std: {}, max: {}".format(self.score.std, self.max_score),
+                 "Score quantiles: {}".format(", ".join(quantiles)),
+                 "Reached tiles:"]
+
+        width = 5
+        for key in sorted(self.tiles):
+            lines.append("{}: {} = {}%".format(str(key).rjust(width), str(self.tiles[key]).rjust(width),
+                                               str(100 * self.tiles[key] / self.count).rjust(width)))
+        return lines
+
+    def write_report(self, file_name, title, model_name, total=None):
+        """
+        Writes the report (see 'get_report') into the specified file (overwrites the previous report).
+        """
+        with open(file_name, "w") as f:
+            for line in self.get_report(title, model_name, total):
+                f.write(line)
+                f.write(os.linesep)
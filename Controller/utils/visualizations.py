@@ -73,6 +73,9 @@ def eval(game, evals, model):
     game_instance = utils.miscellaneous.get_game_instance(game, parameters, test=True)
 
     results = game_instance.run(advanced_results=True)
+    if not isinstance(results, list):
+        # Games with a single player (2048) return only one result
+        results = [results]
     for i, r in enumerate(results):
         if i > 0:
             values.append(("original#{}".format(i), r))
@@ -113,9 +116,15 @@ def run_torcs_vis_on(model, evals):
     results = game_instance.run(advanced_results=True)
 
 
-def run_2048_extended(model, evals):
+def run_2048_extended(model, evals, trajectories_file=None):
+    """
+    Plays the specified number of games of 2048 and logs their statistics.
+    :param trajectories_file: If set, all games are recorded into this file (can be replayed later, see
+    'Game-interfaces/Game2048/trajectories.py').
+    """
     print("Game 2048 with extended logs started.")
-    game_instance = games.game2048.Game2048(model, evals, np.random.randint(0, 2 ** 16))
+    game_instance = games.game2048.Game2048(model, evals, np.random.randint(0, 2 ** 16),
+                                            trajectories_file=trajectories_file)
     results = game_instance.run(advanced_results=True)
     return results
 
@@ -196,6 +205,7 @@ def run_model_evaluator():
     # eval_alhambra_winrate(mlp, evals)
     # run_random_model(game, evals)
     run_2048_extended(mlp, evals)
+    # run_2048_extended(mlp, evals, trajectories_file="2048_trajectories_{}.bin".format(utils.miscellaneous.get_pretty_time()))
     # eval_mario_winrate(model=dqn, evals=evals, level="spikes", vis_on=False)
     # run_torcs_vis_on(model=ddpg, evals=evals)
 
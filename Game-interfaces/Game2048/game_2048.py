@@ -26,14 +26,19 @@ THE SOFTWARE.
 ==================================
 The code itself is a modified version of https://github.com/Mekire/console-2048/blob/master/console2048.py
 https://github.com/tjwei/2048-NN/blob/master/c2048.py. Changes were made to game encoding. To Set encoding, please,
-simply modify method "get_state".
+select it in '2048_config.json' (see 'state_encoders.py') or simply modify method "get_state".
 """
 
 import numpy as np
 
+# Lookup table from tile value to its exponent (log2 of the tile, 0 for an empty cell)
+TILE_EXPONENTS = np.zeros(2 ** 16, dtype=np.uint8)
+TILE_EXPONENTS[2 ** np.arange(1, 16)] = np.arange(1, 16)
+
 
 def push_left(grid):
     moved, score = False, 0
+    empty, mergeable = 0, False
     rows, columns = grid.shape[0], grid.shape[1]
     for k in range(rows):
         i, last = 0, 0
@@ -48,14 +53,23 @@ def push_left(grid):
                     moved |= (i != j)
                     last = grid[k, i] = e
                     i += 1
+        if not mergeable:
+            # Row is final here, compare its tiles with each other and with the previous (final) row
+            for j in range(i):
+                e = grid[k, j]
+                if (j and e == grid[k, j - 1]) or (k and e == grid[k - 1, j]):
+                    mergeable = True
+                    break
         while i < columns:
             grid[k, i] = 0
+            empty |= 1 << (k * columns + i)
             i += 1
-    return score if moved else -1
+    return (score if moved else -1), empty, mergeable
 
 
 def push_right(grid):
     moved, score = False, 0
+    empty, mergeable = 0, False
     rows, columns = grid.shape[0], grid.shape[1]
     for k in range(rows):
         i = columns - 1
@@ -71,14 +85,22 @@ def push_right(grid):
                     moved |= (i != j)
                     last = grid[k, i] = e
                     i -= 1
+        if not mergeable:
+            for j in range(i + 1, columns):
+                e = grid[k, j]
+                if (j > i + 1 and e == grid[k, j - 1]) or (k and e == grid[k - 1, j]):
+                    mergeable = True
+                    break
         while 0 <= i:
             grid[k, i] = 0
+            empty |= 1 << (k * columns + i)
             i -= 1
-    return score if moved else -1
+    return (score if moved else -1), empty, mergeable
 
 
 def push_up(grid):
     moved, score = False, 0
+    empty, mergeable = 0, False
     rows, columns = grid.shape[0], grid.shape[1]
     for k in range(columns):
         i, last = 0, 0
@@ -93,14 +115,22 @@ def push_up(grid):
                     moved |= (i != j)
                     last = grid[i, k] = e
                     i += 1
+        if not mergeable:
+            for j in range(i):
+                e = grid[j, k]
+                if (j and e == grid[j - 1, k]) or (k and e == grid[j, k - 1]):
+                    mergeable = True
+                    break
         while i < rows:
             grid[i, k] = 0
+            empty |= 1 << (i * columns + k)
             i += 1
-    return score if moved else -1
+    return (score if moved else -1), empty, mergeable
 
 
 def push_down(grid):
     moved, score = False, 0
+    empty, mergeable = 0, False
     rows, columns = grid.shape[0], grid.shape[1]
     for k in range(columns):
         i, last = rows - 1, 0
@@ -115,24 +145,60 @@ def push_down(grid):
                     moved |= (i != j)
                     last = grid[i, k] = e
                     i -= 1
+        if not mergeable:
+            for j in range(i + 1, rows):
+                e = grid[j, k]
+                if (j > i + 1 and e == grid[j - 1, k]) or (k and e == grid[j, k - 1]):
+                    mergeable = True
+                    break
         while 0 <= i:
             grid[i, k] = 0
+            empty |= 1 << (i * columns + k)
             i -= 1
-    return score if moved else -1
+    return (score if moved else -1), empty, mergeable
 
 
 def push(grid, direction):
+    """
+    Pushes the grid in the specified direction (0 = left, 1 = up, 2 = right, 3 = down). Summary of the pushed grid
+    (see 'summarize') is collected during the push, so it does not need another scan of the grid.
+    :return: Half of the reward (or -1 if nothing moved), mask of empty cells, whether there are equal neighbours.
+    """
     if direction & 1:
         if direction & 2:
-            score = push_down(grid)
+            return push_down(grid)
         else:
-            score = push_up(grid)
+            return push_up(grid)
     else:
         if direction & 2:
-            score = push_right(grid)
+            return push_right(grid)
         else:
-            score = push_left(grid)
-    return score
+            return push_left(grid)
+
+
+def summarize(grid):
+    """
+    Scans the grid for the summary maintained by the pushes.
+    :return: Mask of empty cells (bit 'row * columns + col' is set for an empty cell), whether there are two equal
+    neighbouring tiles (i.e. a merge is possible).
+    """
+    empty, mergeable = 0, False
+    rows, columns = grid.shape[0], grid.shape[1]
+    for i in range(rows):
+        for j in range(columns):
+            e = grid[i, j]
+            if not e:
+                empty |= 1 << (i * columns + j)
+            elif (j and e == grid[i, j - 1]) or (i and e == grid[i - 1, j]):
+                mergeable = True
+    return empty, mergeable
+
+
+def has_equal_neighbour(grid, i, j):
+    """Return True if the tile at (i, j) equals any of its (up to four) neighbours."""
+    e = grid[i, j]
+    return ((i > 0 and e == grid[i - 1, j]) or (i + 1 < grid.shape[0] and e == grid[i + 1, j]) or
+            (j > 0 and e == grid[i, j - 1]) or (j + 1 < grid.shape[1] and e == grid[i, j + 1]))
 
 
 def put_new_cell(grid, rng):
@@ -152,6 +218,23 @@ def put_new_cell(grid, rng):
     return n
 
 
+def put_new_cell_masked(grid, rng, empty):
+    """
+    Same as 'put_new_cell' (same cell order and usage of the random generator), but empty cells are taken from
+    the mask of empty cells instead of scanning the grid.
+    :return: Number of empty cells before the spawn, index of the new tile ('row * columns + col', -1 if none).
+    """
+    n = bin(empty).count("1")
+    if n == 0:
+        return 0, -1
+    r = rng.randint(0, n)
+    for _ in range(r):
+        empty &= empty - 1  # drop the lowest empty cell
+    cell = (empty & -empty).bit_length() - 1
+    grid[cell // grid.shape[1], cell % grid.shape[1]] = 2 if rng.random_sample() < 0.9 else 4
+    return n, cell
+
+
 def any_possible_moves(grid):
     """Return True if there are any legal moves, and False otherwise."""
     rows = grid.shape[0]
@@ -189,9 +272,11 @@ def print_grid(grid_array):
 
 
 class Game:
-    def __init__(self, seed, cols=4, rows=4):
+    def __init__(self, seed, cols=4, rows=4, encoder=None):
         self.cols = cols
         self.rows = rows
+        self.encoder = encoder
+        self.exponents = np.zeros(rows * cols, dtype=np.uint8)
         self.rng = np.random.RandomState(seed)
         self.grid_array = np.zeros(shape=(rows, cols), dtype='uint16')
         self.grid = self.grid_array
@@ -201,15 +286,45 @@ class Game:
         self.end = False
         self.total_moves = 0
 
+        # Summary of the grid, updated by every move: mask of empty cells (bit 'row * cols + col' is set for an empty
+        # cell) and whether there are two equal neighbouring tiles
+        self.empty_mask, self.mergeable = summarize(self.grid)
+
     def copy(self):
-        rtn = Game(self.grid.shape[0], self.grid.shape[1])
-        for i in range(self.grid.shape[0]):
-            for j in range(self.grid.shape[1]):
-                rtn.grid[i, j] = self.grid[i, j]
-        rtn.score = self.score
-        rtn.end = self.end
+        """
+        Creates an independent copy of the game, including the state of its random generator (the copy spawns
+        the same tiles as the original would).
+        """
+        rtn = Game.__new__(Game)
+        rtn.cols = self.cols
+        rtn.rows = self.rows
+        rtn.encoder = self.encoder
+        rtn.exponents = np.zeros_like(self.exponents)
+        rtn.rng = np.random.RandomState(0)
+        rtn.grid_array = np.empty_like(self.grid_array)
+        rtn.grid = rtn.grid_array
+        rtn.restore(self.snapshot())
         return rtn
 
+    def snapshot(self):
+        """
+        Captures the whole state of the game: grid, score, end flag, number of moves, state of the random generator
+        and summary of the grid.
+        :return: Snapshot to be used in 'restore'.
+        """
+        return (self.grid.copy(), self.score, self.end, self.total_moves, self.rng.get_state(), self.empty_mask,
+                self.mergeable)
+
+    def restore(self, snapshot):
+        """
+        Restores the game from the specified snapshot (created by 'snapshot' of this or other game of the same size).
+        The grid is overwritten in place, so the game can be restored repeatedly without any reallocation.
+        :param snapshot: Snapshot to restore.
+        """
+        grid, self.score, self.end, self.total_moves, rng_state, self.empty_mask, self.mergeable = snapshot
+        np.copyto(self.grid, grid)
+        self.rng.set_state(rng_state)
+
     def max(self):
         m = 0
         for i in range(self.grid.shape[0]):
@@ -218,36 +333,55 @@ class Game:
                     m = self.grid[i, j]
         return m
 
+    @property
+    def empty_cells(self):
+        """
+        Number of empty cells.
+        """
+        return bin(self.empty_mask).count("1")
+
     def move(self, direction):
-        if direction & 1:
-            if direction & 2:
-                score = push_down(self.grid)
-            else:
-                score = push_up(self.grid)
-        else:
-            if direction & 2:
-                score = push_right(self.grid)
-            else:
-                score = push_left(self.grid)
+        score, empty_mask, mergeable = push(self.grid, direction)
         if score == -1:
             return 0, None
         score *= 2  # We want result as a score (2 + 2 merged should be score "4" not "2")
         reward = score
         self.total_moves += 1
         self.score += score
-        if not prepare_next_turn(self.grid, self.rng):
+        self.empty_mask, self.mergeable = empty_mask, mergeable
+        if not self.prepare_next_turn():
             self.end = True
         return 1, reward
 
+    def prepare_next_turn(self):
+        """
+        Spawns a new tile and updates the summary of the grid (only the new tile and its neighbours are checked).
+        :return: Whether there is any legal move after the spawn.
+        """
+        empties, cell = put_new_cell_masked(self.grid, self.rng, self.empty_mask)
+        if cell >= 0:
+            self.empty_mask &= ~(1 << cell)
+            self.mergeable = self.mergeable or has_equal_neighbour(self.grid, cell // self.cols, cell % self.cols)
+        return empties > 1 or self.mergeable
+
     def display(self):
         print_grid(self.grid_array)
 
     def get_state(self):
-        # FEEL FREE CHANGE THIS ENCODING
+        # FEEL FREE CHANGE THIS ENCODING (or select the encoder, see 'state_encoders.py')
+        if self.encoder is not None:
+            return self.encoder.encode(self.get_exponents())
 
         # return self.get_state_onehot()
         return self.get_state_raw()
 
+    def get_exponents(self):
+        """
+        Returns exponents of tiles (row-major order). The returned buffer is overwritten by the next call.
+        """
+        np.take(TILE_EXPONENTS, self.grid.ravel(), out=self.exponents)
+        return self.exponents
+
     def get_state_raw(self):
         return np.array([np.log2(x) if x > 0 else .0 for x in self.grid.flatten()])
 
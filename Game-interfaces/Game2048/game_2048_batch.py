@@ -0,0 +1,287 @@
+"""
+Vectorized (batch) version of game 2048. Holds N boards in a single (N, 4, 4) array and applies one action per
+board in every step. Merges (through a precomputed 65,536-entry lookup table of rows), spawns of new tiles, game-over
+detection and state encoding are NumPy operations over the whole batch, so the cost of a step does not depend
+(in Python terms) on the number of boards.
+
+Cells store exponents of tiles (0 = empty cell, 1 = tile 2, 2 = tile 4, ...), directions are the same as in
+'game_2048.py' (0 = left, 1 = up, 2 = right, 3 = down). Every board has its own random stream (counter-based
+SplitMix64 generator seeded by the seed of the board), so a board plays the same game regardless of the batch
+it is part of. Note that the random streams differ from 'numpy.random.RandomState' used in 'game_2048.py',
+games are therefore not identical to the single-game engines.
+"""
+
+import numpy as np
+
+GOLDEN_GAMMA = np.uint64(0x9E3779B97F4A7C15)
+MIX_1 = np.uint64(0xBF58476D1CE4E5B9)
+MIX_2 = np.uint64(0x94D049BB133111EB)
+DIRECTIONS = 4
+MAX_EXPONENT = 15
+ROW_MASK = 0xFFFF
+ROW_SHIFTS = np.array([0, 4, 8, 12], dtype=np.uint16)
+
+
+def _mix64(z):
+    """
+    Finalizer of SplitMix64 generator (applied element-wise on uint64 array).
+    """
+    z = (z ^ (z >> np.uint64(30))) * MIX_1
+    z = (z ^ (z >> np.uint64(27))) * MIX_2
+    return z ^ (z >> np.uint64(31))
+
+
+def to_view(boards, direction):
+    """
+    Returns view of boards oriented in a way that the specified direction becomes a push to the left.
+    :param boards: Boards of shape (N, rows, cols).
+    :param direction: Direction of the push.
+    :return: Oriented view of boards.
+    """
+    if direction & 1:
+        boards = boards.transpose(0, 2, 1)
+    if direction & 2:
+        boards = boards[:, :, ::-1]
+    return boards
+
+
+def from_view(boards, direction):
+    """
+    Inverse of 'to_view'.
+    """
+    if direction & 2:
+        boards = boards[:, :, ::-1]
+    if direction & 1:
+        boards = boards.transpose(0, 2, 1)
+    return boards
+
+
+def compress_left(boards):
+    """
+    Moves all tiles to the left, keeping their order (no merging).
+    :param boards: Boards of shape (N, rows, cols).
+    :return: Compressed boards (new array).
+    """
+    order = np.argsort(boards == 0, axis=2, kind="stable")
+    return np.take_along_axis(boards, order, axis=2)
+
+
+def push_left(boards):
+    """
+    Pushes all boards to the left (generic version, used to build lookup tables).
+    :param boards: Boards of shape (N, rows, cols).
+    :return: Pushed boards (new array), reward of every board.
+    """
+    x = compress_left(boards)
+    reward = np.zeros(x.shape[0], dtype=np.int64)
+    for j in range(x.shape[2] - 1):
+        merged = (x[:, :, j] == x[:, :, j + 1]) & (x[:, :, j] != 0) & (x[:, :, j] < MAX_EXPONENT)
+        x[:, :, j] += merged
+        x[:, :, j + 1] *= ~merged  # zero also prevents merging with the next cell
+        reward += np.sum(np.where(merged, np.left_shift(1, x[:, :, j].astype(np.int64)), 0), axis=1)
+    return compress_left(x), reward
+
+
+def pack_rows(boards):
+    """
+    Packs rows of 4 exponents into 16-bit integers (indices to lookup tables).
+    :param boards: Array of shape (..., 4).
+    :return: Array of shape (...).
+    """
+    return np.bitwise_or.reduce(boards.astype(np.uint16) << ROW_SHIFTS, axis=-1)
+
+
+def unpack_rows(rows):
+    """
+    Inverse of 'pack_rows'.
+    """
+    return ((rows[..., np.newaxis] >> ROW_SHIFTS) & 0xF).astype(np.uint8)
+
+
+def _build_tables():
+    """
+    Precomputes push to the left and its reward for all 65,536 possible rows.
+    """
+    rows = np.arange(ROW_MASK + 1, dtype=np.uint16)
+    pushed, reward = push_left(unpack_rows(rows)[:, np.newaxis, :])
+    return pack_rows(pushed[:, 0, :]), reward
+
+
+ROW_LEFT, REWARD_LEFT = _build_tables()
+
+
+def push_all(boards):
+    """
+    Pushes boards in all four directions.
+    :param boards: Boards of shape (N, 4, 4).
+    :return: Pushed boards of shape (4, N, 4, 4), rewards of shape (4, N), whether the boards moved of shape (4, N).
+    """
+    rows = np.stack([pack_rows(to_view(boards, d)) for d in range(DIRECTIONS)])
+    pushed_rows = ROW_LEFT[rows]
+    pushed = unpack_rows(pushed_rows)
+    pushed = np.stack([from_view(pushed[d], d) for d in range(DIRECTIONS)])
+    return pushed, REWARD_LEFT[rows].sum(axis=2), (pushed_rows != rows).any(axis=2)
+
+
+def any_possible_moves(boards):
+    """Return boolean array, True for boards with any legal move."""
+    return ((boards == 0).any(axis=(1, 2)) |
+            (boards[:, :, 1:] == boards[:, :, :-1]).any(axis=(1, 2)) |
+            (boards[:, 1:, :] == boards[:, :-1, :]).any(axis=(1, 2)))
+
+
+class GameBatch:
+    """
+    Represents N games of 2048 played at once (in lockstep).
+    """
+
+    def __init__(self, seeds, cols=4, rows=4, boards=None):
+        """
+        Initializes a new batch of games.
+        :param seeds: Seeds of the games (one for each board).
+        :param cols: Number of columns of the grid (only 4 is supported).
+        :param rows: Number of rows of the grid (only 4 is supported).
+        :param boards: Boards (exponents of tiles) to start from, or None to start every board with two random tiles.
+        """
+        if cols != 4 or rows != 4:
+            raise ValueError("Batch engine supports only 4x4 grid.")
+        self.cols = cols
+        self.rows = rows
+        self.n = len(seeds)
+        self.rng_state = _mix64(np.asarray(seeds, dtype=np.uint64))
+        self.score = np.zeros(self.n, dtype=np.int64)
+        self.end = np.zeros(self.n, dtype=bool)
+        self.total_moves = np.zeros(self.n, dtype=np.int64)
+
+        if boards is None:
+            self.boards = np.zeros(shape=(self.n, rows, cols), dtype=np.uint8)
+            everyone = np.arange(self.n)
+            for _ in range(2):
+                self.put_new_cell(everyone)
+        else:
+            self.boards = np.array(boards, dtype=np.uint8).reshape(self.n, rows, cols)
+            self.end = ~any_possible_moves(self.boards)
+
+    def take(self, indices):
+        """
+        Creates a new batch containing only the specified games (including their random streams).
+        :param indices: Indices (or boolean mask) of games to keep.
+        :return: New instance of GameBatch.
+        """
+        games = GameBatch.__new__(GameBatch)
+        games.cols = self.cols
+        games.rows = self.rows
+        games.rng_state = self.rng_state[indices]
+        games.boards = self.boards[indices]
+        games.score = self.score[indices]
+        games.end = self.end[indices]
+        games.total_moves = self.total_moves[indices]
+        games.n = len(games.boards)
+        return games
+
+    def random(self, indices):
+        """
+        Draws a uniform [0, 1) number from stream of each of the specified boards.
+        :param indices: Indices of boards.
+        :return: Array of random numbers.
+        """
+        self.rng_state[indices] += GOLDEN_GAMMA
+        return (_mix64(self.rng_state[indices]) >> np.uint64(11)) * (1.0 / 2 ** 53)
+
+    def put_new_cell(self, indices):
+        """
+        Spawns a new tile (2 with probability 0.9, otherwise 4) on a random empty cell of the specified boards.
+        :param indices: Indices of boards.
+        :return: Number of empty cells of each board (before the spawn).
+        """
+        cells = self.boards[indices].reshape(len(indices), self.rows * self.cols)
+        empties = cells == 0
+        n = empties.sum(axis=1)
+        r = np.minimum((self.random(indices) * n).astype(np.int64), np.maximum(n - 1, 0))
+        tile = np.where(self.random(indices) < 0.9, 1, 2).astype(np.uint8)
+
+        has_empty = n > 0
+        position = np.argmax(empties & (np.cumsum(empties, axis=1) == (r + 1)[:, np.newaxis]), axis=1)
+        rows = indices[has_empty]
+        flat = self.boards.reshape(self.n, self.rows * self.cols)
+        flat[rows, position[has_empty]] = tile[has_empty]
+        return n
+
+    def legal_moves(self):
+        """
+        Determines legal moves of all boards.
+        :return: Boolean array of shape (N, 4).
+        """
+        return push_all(self.boards)[2].T
+
+    def move(self, actions):
+        """
+        Applies one action per board. Finished boards and boards where the action does not change anything are
+        left untouched.
+        :param actions: Array of N directions.
+        :return: Boolean array (whether the board moved), array of rewards.
+        """
+        running = np.flatnonzero(~self.end)
+        pushed, reward, moved = push_all(self.boards[running])
+        return self.apply(running, np.asarray(actions)[running], pushed, reward, moved)
+
+    def move_ranked(self, preferences):
+        """
+        Plays the most preferred legal move of each board (same as trying moves in the order of preference, see
+        'Game2048.run').
+        :param preferences: Array of shape (N, 4), higher value means more preferred move.
+        :return: Boolean array (whether the board moved), array of rewards.
+        """
+        running = np.flatnonzero(~self.end)
+        pushed, reward, moved = push_all(self.boards[running])
+        preferences = np.where(moved.T, np.asarray(preferences, dtype=float)[running], -np.inf)
+        return self.apply(running, np.argmax(preferences, axis=1), pushed, reward, moved)
+
+    def apply(self, running, actions, pushed, reward, moved):
+        """
+        Applies the selected actions of running boards (results of 'push_all').
+        :param running: Indices of running boards.
+        :param actions: Selected action of each running board.
+        :return: Boolean array (whether the board moved), array of rewards (both of length N).
+        """
+        selected = np.arange(len(running))
+        moved_running = moved[actions, selected]
+        indices = running[moved_running]
+
+        all_moved = np.zeros(self.n, dtype=bool)
+        all_reward = np.zeros(self.n, dtype=np.int64)
+        all_moved[indices] = True
+        all_reward[indices] = reward[actions, selected][moved_running]
+        self.boards[indices] = pushed[actions, selected][moved_running]
+
+        self.score += all_reward
+        self.total_moves += all_moved
+        self.prepare_next_turn(indices)
+        return all_moved, all_reward
+
+    def prepare_next_turn(self, indices):
+        """
+        Spawns a new tile on the specified boards and checks whether their games have ended.
+        :param indices: Indices of boards.
+        """
+        empties = self.put_new_cell(indices)
+        self.end[indices] = ~((empties > 1) | any_possible_moves(self.boards[indices]))
+
+    def max(self):
+        """
+        Returns the largest tile of each board.
+        """
+        m = self.boards.reshape(self.n, self.rows * self.cols).max(axis=1).astype(np.int64)
+        return np.where(m > 0, np.left_shift(1, m), 0)
+
+    def get_state(self, encoder=None):
+        """
+        Returns states of all boards.
+        :param encoder: Encoder for N boards (see 'state_encoders.py'), or None for raw encoding (log2 of tiles as in
+        'game_2048.Game.get_state_raw').
+        :return: Array of shape (N, state size).
+        """
+        exponents = self.boards.reshape(self.n, self.rows * self.cols)
+        if encoder is not None:
+            return encoder.encode(exponents)
+        return exponents.astype(float)
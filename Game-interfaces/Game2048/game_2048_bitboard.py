@@ -0,0 +1,341 @@
+"""
+Bitboard backend of game 2048. The whole 4x4 board is packed into a single 64-bit integer, where every cell is
+a 4-bit exponent of the tile (0 = empty cell, 1 = tile 2, 2 = tile 4, ...). Cell (row, col) is stored in the nibble
+with index 4 * row + col (nibble 0 are the lowest 4 bits).
+
+Moves are applied through precomputed 65,536-entry lookup tables for a single row (left and right push); columns
+are handled by transposing the board. The tables also contain precomputed reward of each row push.
+
+The class 'Game' is drop-in compatible with 'Game' from 'game_2048.py' (same constructor, 'move', 'get_state', 'score',
+'end', 'total_moves', 'max' and 'display') and uses the random generator in exactly the same way, so both backends
+produce identical trajectories for the same seed. Only 4x4 boards are supported and the largest tile is 32768
+(two 32768 tiles are never merged, the original uint16 grid overflows at that point anyway).
+"""
+
+import numpy as np
+
+ROW_MASK = 0xFFFF
+NIBBLE_LOW_BITS = 0x1111111111111111
+MAX_EXPONENT = 15
+NIBBLE_SHIFTS = np.arange(0, 64, 4, dtype=np.uint64)
+
+
+def _push_row_left(exponents):
+    """
+    Pushes a single row (list of 4 exponents) to the left.
+    :param exponents: Row to push.
+    :return: Pushed row, reward of the push (sum of newly merged tiles).
+    """
+    tiles = [e for e in exponents if e]
+    result = []
+    reward = 0
+    i = 0
+    while i < len(tiles):
+        e = tiles[i]
+        if i + 1 < len(tiles) and tiles[i + 1] == e and e < MAX_EXPONENT:
+            result.append(e + 1)
+            reward += 2 ** (e + 1)
+            i += 2
+        else:
+            result.append(e)
+            i += 1
+    return result + [0] * (4 - len(result)), reward
+
+
+def _pack_row(exponents):
+    return exponents[0] | (exponents[1] << 4) | (exponents[2] << 8) | (exponents[3] << 12)
+
+
+def _unpack_row(row):
+    return [row & 0xF, (row >> 4) & 0xF, (row >> 8) & 0xF, (row >> 12) & 0xF]
+
+
+def _build_tables():
+    """
+    Precomputes lookup tables for all 65,536 possible rows.
+    :return: Left push, right push, reward of the left push, reward of the right push, whether any move is possible,
+    mask of empty cells (bit 'col' is set for an empty cell), whether there are two equal neighbouring tiles.
+    """
+    row_left = [0] * (ROW_MASK + 1)
+    row_right = [0] * (ROW_MASK + 1)
+    reward_left = [0] * (ROW_MASK + 1)
+    reward_right = [0] * (ROW_MASK + 1)
+    row_open = [False] * (ROW_MASK + 1)
+    row_empty = [0] * (ROW_MASK + 1)
+    row_pairs = [False] * (ROW_MASK + 1)
+    for row in range(ROW_MASK + 1):
+        exponents = _unpack_row(row)
+
+        pushed, reward = _push_row_left(exponents)
+        row_left[row] = _pack_row(pushed)
+        reward_left[row] = reward
+
+        pushed, reward = _push_row_left(exponents[::-1])
+        row_right[row] = _pack_row(pushed[::-1])
+        reward_right[row] = reward
+
+        row_open[row] = (0 in exponents) or any(exponents[i] == exponents[i + 1] for i in range(3))
+        row_empty[row] = sum(1 << i for i in range(4) if not exponents[i])
+        row_pairs[row] = any(exponents[i] and exponents[i] == exponents[i + 1] for i in range(3))
+    return row_left, row_right, reward_left, reward_right, row_open, row_empty, row_pairs
+
+
+ROW_LEFT, ROW_RIGHT, REWARD_LEFT, REWARD_RIGHT, ROW_OPEN, ROW_EMPTY, ROW_PAIRS = _build_tables()
+
+
+def transpose(board):
+    """
+    Transposes the board (rows become columns).
+    :param board: Board to transpose.
+    :return: Transposed board.
+    """
+    a1 = board & 0xF0F00F0FF0F00F0F
+    a2 = board & 0x0000F0F00000F0F0
+    a3 = board & 0x0F0F00000F0F0000
+    a = a1 | (a2 << 12) | (a3 >> 12)
+    b1 = a & 0xFF00FF0000FF00FF
+    b2 = a & 0x00FF00FF00000000
+    b3 = a & 0x00000000FF00FF00
+    return b1 | (b2 >> 24) | (b3 << 24)
+
+
+def push_rows(board, row_table, reward_table):
+    """
+    Pushes all four rows of the board using the specified lookup tables.
+    :param board: Board to push.
+    :param row_table: Lookup table of pushed rows (ROW_LEFT or ROW_RIGHT).
+    :param reward_table: Lookup table of rewards (REWARD_LEFT or REWARD_RIGHT).
+    :return: Pushed board, reward of the push.
+    """
+    r0 = board & ROW_MASK
+    r1 = (board >> 16) & ROW_MASK
+    r2 = (board >> 32) & ROW_MASK
+    r3 = (board >> 48) & ROW_MASK
+    pushed = row_table[r0] | (row_table[r1] << 16) | (row_table[r2] << 32) | (row_table[r3] << 48)
+    reward = reward_table[r0] + reward_table[r1] + reward_table[r2] + reward_table[r3]
+    return pushed, reward
+
+
+def push(board, direction):
+    """
+    Pushes the board in the specified direction (0 = left, 1 = up, 2 = right, 3 = down).
+    :param board: Board to push.
+    :param direction: Direction of the push.
+    :return: Pushed board, reward of the push.
+    """
+    if direction & 2:
+        tables = ROW_RIGHT, REWARD_RIGHT
+    else:
+        tables = ROW_LEFT, REWARD_LEFT
+    if direction & 1:
+        pushed, reward = push_rows(transpose(board), *tables)
+        return transpose(pushed), reward
+    return push_rows(board, *tables)
+
+
+def any_possible_moves(board):
+    """Return True if there are any legal moves, and False otherwise."""
+    t = transpose(board)
+    for shift in (0, 16, 32, 48):
+        if ROW_OPEN[(board >> shift) & ROW_MASK] or ROW_OPEN[(t >> shift) & ROW_MASK]:
+            return True
+    return False
+
+
+def empty_mask(board):
+    """
+    Returns a mask of empty cells; the lowest bit of every empty nibble is set.
+    :param board: Board to check.
+    :return: Mask of empty cells.
+    """
+    occupied = board | (board >> 1)
+    occupied |= occupied >> 2
+    return ~occupied & NIBBLE_LOW_BITS
+
+
+def put_new_cell(board, rng):
+    """
+    Spawns a new tile on a random empty cell. Cells are enumerated in the same (row-major) order and the random
+    generator is used in the same way as in 'game_2048.put_new_cell'.
+    :param board: Board to spawn the tile on.
+    :param rng: Random generator.
+    :return: New board, number of empty cells before the spawn.
+    """
+    mask = empty_mask(board)
+    n = bin(mask).count("1")
+    if n > 0:
+        r = rng.randint(0, n)
+        for _ in range(r):
+            mask &= mask - 1  # drop the lowest empty cell
+        exponent = 1 if rng.random_sample() < 0.9 else 2
+        board |= exponent << ((mask & -mask).bit_length() - 1)
+    return board, n
+
+
+def to_exponents(board):
+    """
+    Unpacks the board into an array of 16 exponents (row-major order).
+    :param board: Board to unpack.
+    :return: Array of exponents.
+    """
+    return (np.uint64(board) >> NIBBLE_SHIFTS) & np.uint64(0xF)
+
+
+def from_grid(grid):
+    """
+    Packs a grid of tile values (e.g. 'grid' of 'game_2048.Game') into a board.
+    :param grid: 4x4 array of tile values.
+    :return: Packed board.
+    """
+    board = 0
+    for i, value in enumerate(np.asarray(grid).flatten()):
+        if value:
+            board |= (int(value).bit_length() - 1) << (4 * i)
+    return board
+
+
+def print_grid(grid_array):
+    """Print a pretty grid to the screen."""
+    print("")
+    wall = "+------" * grid_array.shape[1] + "+"
+    print(wall)
+    for i in range(grid_array.shape[0]):
+        meat = "|".join("{:^6}".format(grid_array[i, j]) for j in range(grid_array.shape[1]))
+        print("|{}|".format(meat))
+        print(wall)
+
+
+class Game:
+    def __init__(self, seed, cols=4, rows=4, encoder=None):
+        if cols != 4 or rows != 4:
+            raise ValueError("Bitboard backend supports only 4x4 grid.")
+        self.cols = cols
+        self.rows = rows
+        self.encoder = encoder
+        self.exponents = np.zeros(rows * cols, dtype=np.uint64)
+        self.rng = np.random.RandomState(seed)
+        self.board = 0
+        for i in range(2):
+            self.board, _ = put_new_cell(self.board, self.rng)
+        self.score = 0
+        self.end = False
+        self.total_moves = 0
+
+    @property
+    def grid(self):
+        """
+        Grid of tile values (a new 4x4 uint16 array; changes are not written back to the board).
+        """
+        exponents = to_exponents(self.board).astype('uint16')
+        grid = np.where(exponents > 0, np.left_shift(np.uint16(1), exponents), 0).astype('uint16')
+        return grid.reshape(self.rows, self.cols)
+
+    @property
+    def grid_array(self):
+        return self.grid
+
+    @property
+    def empty_mask(self):
+        """
+        Mask of empty cells, bit 'row * cols + col' is set for an empty cell (same as 'empty_mask' of 'game_2048.Game').
+        """
+        board = self.board
+        return (ROW_EMPTY[board & ROW_MASK] | (ROW_EMPTY[(board >> 16) & ROW_MASK] << 4) |
+                (ROW_EMPTY[(board >> 32) & ROW_MASK] << 8) | (ROW_EMPTY[board >> 48] << 12))
+
+    @property
+    def mergeable(self):
+        """
+        Whether there are two equal neighbouring tiles (i.e. a merge is possible).
+        """
+        board = self.board
+        t = transpose(board)
+        return (ROW_PAIRS[board & ROW_MASK] or ROW_PAIRS[(board >> 16) & ROW_MASK] or
+                ROW_PAIRS[(board >> 32) & ROW_MASK] or ROW_PAIRS[board >> 48] or
+                ROW_PAIRS[t & ROW_MASK] or ROW_PAIRS[(t >> 16) & ROW_MASK] or
+                ROW_PAIRS[(t >> 32) & ROW_MASK] or ROW_PAIRS[t >> 48])
+
+    @property
+    def empty_cells(self):
+        """
+        Number of empty cells.
+        """
+        return bin(empty_mask(self.board)).count("1")
+
+    def copy(self):
+        """
+        Creates an independent copy of the game, including the state of its random generator (the copy spawns
+        the same tiles as the original would).
+        """
+        rtn = Game.__new__(Game)
+        rtn.cols = self.cols
+        rtn.rows = self.rows
+        rtn.encoder = self.encoder
+        rtn.exponents = np.zeros_like(self.exponents)
+        rtn.rng = np.random.RandomState(0)
+        rtn.restore(self.snapshot())
+        return rtn
+
+    def snapshot(self):
+        """
+        Captures the whole state of the game: board, score, end flag, number of moves and state of the random
+        generator.
+        :return: Snapshot to be used in 'restore'.
+        """
+        return self.board, self.score, self.end, self.total_moves, self.rng.get_state()
+
+    def restore(self, snapshot):
+        """
+        Restores the game from the specified snapshot (created by 'snapshot' of this or other game).
+        :param snapshot: Snapshot to restore.
+        """
+        self.board, self.score, self.end, self.total_moves, rng_state = snapshot
+        self.rng.set_state(rng_state)
+
+    def max(self):
+        m = 0
+        board = self.board
+        while board:
+            m = max(m, board & 0xF)
+            board >>= 4
+        return 2 ** m if m else 0
+
+    def move(self, direction):
+        board, score = push(self.board, direction)
+        if board == self.board:
+            return 0, None
+        reward = score
+        self.total_moves += 1
+        self.score += score
+        self.board, empties = put_new_cell(board, self.rng)
+        if not (empties > 1 or any_possible_moves(self.board)):
+            self.end = True
+        return 1, reward
+
+    def display(self):
+        print_grid(self.grid)
+
+    def get_state(self):
+        if self.encoder is not None:
+            return self.encoder.encode(self.get_exponents())
+        return self.get_state_raw()
+
+    def get_exponents(self):
+        """
+        Returns exponents of tiles (row-major order), unpacked directly from the board. The returned buffer is
+        overwritten by the next call.
+        """
+        np.right_shift(np.uint64(self.board), NIBBLE_SHIFTS, out=self.exponents)
+        np.bitwise_and(self.exponents, np.uint64(0xF), out=self.exponents)
+        return self.exponents
+
+    def get_state_raw(self):
+        return to_exponents(self.board).astype(float)
+
+    def get_state_onehot(self):
+        MAX_POWER = 16
+        x = np.zeros(shape=(self.rows * self.cols, MAX_POWER), dtype=float)
+        exponents = to_exponents(self.board).astype(int)
+        occupied = exponents > 0
+        x[np.arange(self.rows * self.cols)[occupied], exponents[occupied] - 1] = 1
+        return x.flatten()
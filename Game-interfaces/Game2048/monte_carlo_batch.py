@@ -0,0 +1,125 @@
+"""
+Batched Monte Carlo rollouts for the Game 2048 (used by 'monte_carlo_tryout.py'). All random playouts of all candidate
+root actions are played at once, using vectorized 'GameBatch'. Playouts of a single move can also be spread across
+several processes, and clearly inferior root actions can be dropped early using successive rejects (Audibert & Bubeck,
+2010), so the budget of rollouts is spent mostly on the promising actions.
+"""
+
+import numpy as np
+from multiprocessing import Pool
+from game_2048_batch import GameBatch, push_all, DIRECTIONS
+
+
+def play_out(args):
+    """
+    Plays random games from the specified boards (after the move, before spawning a new tile) until they end.
+    :param args: Tuple (boards, seed); boards of shape (N, rows, cols) of exponents, seed of the rollouts.
+    :return: Score gained by each of the random games.
+    """
+    boards, seed = args
+    if len(boards) == 0:
+        return np.zeros(0, dtype=np.int64)
+    rng = np.random.RandomState(seed)
+    games = GameBatch(rng.randint(0, 2 ** 62, size=len(boards), dtype=np.int64), boards=boards)
+    games.prepare_next_turn(np.arange(games.n))
+
+    scores = np.zeros(games.n, dtype=np.int64)
+    running = np.arange(games.n)
+    while games.n > 0:
+        games.move_ranked(rng.random_sample((games.n, DIRECTIONS)))  # uniformly random legal move
+        if games.end.any():
+            # Drop finished games, so they don't cost anything in following steps
+            scores[running[games.end]] = games.score[games.end]
+            running = running[~games.end]
+            games = games.take(~games.end)
+    return scores
+
+
+class RolloutEngine:
+    """
+    Chooses moves of the Game 2048 using random rollouts.
+    """
+
+    def __init__(self, rollouts, processes=1, successive_rejects=False, seed=None):
+        """
+        Initializes a new instance of RolloutEngine.
+        :param rollouts: Number of rollouts per each legal root action (total budget of a move is rollouts times number
+        of legal actions).
+        :param processes: Number of processes used to play rollouts of a single move.
+        :param successive_rejects: If true, the budget is spent in phases and the worst action is dropped after each
+        phase. Otherwise, all actions get the same number of rollouts.
+        :param seed: A random seed for rollouts.
+        """
+        self.rollouts = rollouts
+        self.processes = processes
+        self.successive_rejects = successive_rejects
+        self.rng = np.random.RandomState(seed)
+        self.pool = Pool(processes) if processes > 1 else None
+
+    def play_out(self, boards):
+        """
+        Plays random games from the specified boards, spread across processes of the engine.
+        :param boards: Boards of shape (N, rows, cols).
+        :return: Score gained by each of the random games.
+        """
+        seeds = self.rng.randint(0, 2 ** 31, size=max(1, self.processes))
+        if self.pool is None:
+            return play_out((boards, seeds[0]))
+        chunks = np.array_split(boards, self.processes)
+        return np.concatenate(self.pool.map(play_out, zip(chunks, seeds)))
+
+    def get_phase_sizes(self, arms):
+        """
+        Returns the number of rollouts of each surviving action after each phase of successive rejects.
+        :param arms: Number of candidate actions.
+        :return: List of cumulative rollouts per action (one item per phase).
+        """
+        if not self.successive_rejects or arms == 1:
+            return [self.rollouts]
+        budget = self.rollouts * arms
+        log_bar = 0.5 + sum(1.0 / i for i in range(2, arms + 1))
+        return [max(1, int(np.ceil((budget - arms) / (log_bar * (arms + 1 - k))))) for k in range(1, arms)]
+
+    def get_best_move(self, grid):
+        """
+        Returns the best move for the specified grid.
+        :param grid: Grid of tile values (e.g. 'grid' of 'game_2048.Game').
+        :return: Best move (direction).
+        """
+        grid = np.asarray(grid)
+        exponents = np.zeros(grid.shape, dtype=np.uint8)
+        exponents[grid > 0] = np.log2(grid[grid > 0]).astype(np.uint8)
+
+        # Play each root action once, rollouts then start from the pushed boards
+        pushed, reward, moved = push_all(exponents[np.newaxis])
+        arms = [d for d in range(DIRECTIONS) if moved[d, 0]]
+        children = [pushed[d, 0] for d in arms]
+        rewards = [reward[d, 0] for d in arms]
+        if len(arms) == 0:
+            return 0
+
+        totals = np.zeros(DIRECTIONS)
+        counts = np.zeros(DIRECTIONS)
+        done = 0
+        for size in self.get_phase_sizes(len(arms)):
+            boards = np.repeat(np.array(children), size - done, axis=0)
+            scores = self.play_out(boards).reshape(len(arms), size - done)
+            for i, d in enumerate(arms):
+                totals[d] += scores[i].sum() + rewards[i] * (size - done)
+                counts[d] += size - done
+            done = size
+
+            if self.successive_rejects and len(arms) > 1:
+                worst = min(range(len(arms)), key=lambda i: totals[arms[i]] / counts[arms[i]])
+                del arms[worst], children[worst], rewards[worst]
+
+        # Only the surviving actions (one after successive rejects) are candidates
+        return max(arms, key=lambda d: totals[d] / counts[d])
+
+    def close(self):
+        """
+        Terminates processes of the engine.
+        """
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
@@ -8,19 +8,36 @@ import numpy as np
 import time
 import os
 from game_2048 import Game
+from monte_carlo_batch import RolloutEngine
 from multiprocessing import Pool
 
 THREADS = 8
 ITERS_PER_STEP = 100
 GAMES_TO_PLAY = 1000
 
+# Batched rollouts (all rollouts of a move are played at once, see 'monte_carlo_batch.py')
+BATCHED = True
+# Drop inferior moves early (successive rejects), only with batched rollouts
+SUCCESSIVE_REJECTS = False
+# Processes used for rollouts of a single game; if more than 1, games are played one after one
+ROLLOUT_PROCESSES = 1
+
 np.random.seed(42)
 
 def monte_carlo(game_index):
     game = Game(seed=game_index)
+    engine = None
+    if BATCHED:
+        engine = RolloutEngine(ITERS_PER_STEP, processes=ROLLOUT_PROCESSES, successive_rejects=SUCCESSIVE_REJECTS,
+                               seed=game_index)
     while not game.end:
-        action = get_best_move(game)
+        if engine is None:
+            action = get_best_move(game)
+        else:
+            action = engine.get_best_move(game.grid)
         moved, _ = game.move(action)
+    if engine is not None:
+        engine.close()
     print("Game: {}: Score: {}, Max: {}".format(game_index, game.score, game.max()))
     return game
 
@@ -30,10 +47,15 @@ def get_best_move(game):
     moves = [0, 1, 2, 3]
     for action in moves:
         game_copy = game.copy()
+        # The copy has the random generator of the game, it must not know the tiles the game is going to spawn
+        game_copy.rng = np.random.RandomState(np.random.randint(2 ** 31))
         moved, _ = game_copy.move(action)
         if moved:
+            snapshot = game_copy.snapshot()
+            g = game_copy.copy()
             for iter in range(ITERS_PER_STEP):
-                g = game_copy.copy()
+                g.restore(snapshot)
+                g.rng.seed(np.random.randint(2 ** 31))  # independent tiles in every rollout
                 results[action] += random_play(g)
 
     for i in range(len(results)):
@@ -69,8 +91,11 @@ if __name__ == '__main__':
     scores = []
 
     # Evaluate games
-    p = Pool(THREADS)
-    results = p.map(monte_carlo, range(GAMES_TO_PLAY))
+    if BATCHED and ROLLOUT_PROCESSES > 1:
+        results = [monte_carlo(i) for i in range(GAMES_TO_PLAY)]
+    else:
+        p = Pool(THREADS)
+        results = p.map(monte_carlo, range(GAMES_TO_PLAY))
 
     # Just logging stuff and print results
     for i in range(GAMES_TO_PLAY):
@@ -91,6 +116,9 @@ if __name__ == '__main__':
         f.write(os.linesep)
         f.write("Model: Monte Carlo (MC) [only for 2048 out of curiosity purposes]")
         f.write(os.linesep)
+        f.write("Batched: {}, Successive rejects: {}, Rollout processes: {}".format(BATCHED, SUCCESSIVE_REJECTS,
+                                                                                  ROLLOUT_PROCESSES))
+        f.write(os.linesep)
         f.write("Total Runtime: {}, Avg time per game: {}sec".format(get_elapsed_time(start),
                                                                      (end - start) / GAMES_TO_PLAY))
         f.write(os.linesep)
@@ -0,0 +1,84 @@
+"""
+Encoders of the game 2048 state (input of models). Every encoder writes into its own preallocated output buffer,
+which is reused (overwritten) by the next call of 'encode', so the encoding does not allocate anything per move.
+Encoders work on exponents of tiles (0 = empty cell, 1 = tile 2, 2 = tile 4, ...), which all engines provide directly
+(the bitboard engine derives them from the packed board, NumPy engine uses a lookup table from tile value to exponent).
+
+Encoding used by the game is selected by the 'encoding' key in '2048_config.json' (don't forget to change
+'input_sizes' accordingly):
+* raw: log2 of each tile (16 inputs)
+* onehot: one-hot vector of the exponent of each tile (16 x 16 = 256 inputs)
+"""
+
+import numpy as np
+
+MAX_POWER = 16
+
+
+class Encoder:
+    """
+    Interface for game state encoders.
+    """
+    features_per_cell = None
+
+    def __init__(self, cells=16, n=None):
+        """
+        Initializes a new encoder.
+        :param cells: Number of cells of the grid.
+        :param n: Number of boards encoded at once (batch engine), or None for a single board.
+        """
+        self.size = cells * self.features_per_cell
+        shape = (self.size,) if n is None else (n, self.size)
+        self.output = np.zeros(shape=shape, dtype=float)
+
+    def encode(self, exponents):
+        """
+        Encodes the specified board(s) into the output buffer.
+        :param exponents: Exponents of tiles, array of shape (cells,) or (n, cells).
+        :return: Output buffer with encoded state (valid until the next call).
+        """
+        raise NotImplementedError
+
+
+class RawEncoder(Encoder):
+    """
+    Encodes every tile as its log2 (0 for empty cells).
+    """
+    features_per_cell = 1
+
+    def encode(self, exponents):
+        np.copyto(self.output, exponents, casting="unsafe")
+        return self.output
+
+
+class OneHotEncoder(Encoder):
+    """
+    Encodes every tile as one-hot vector of its exponent (empty cell is a zero vector).
+    """
+    features_per_cell = MAX_POWER
+
+    # Row 'e' contains the one-hot vector of exponent 'e'
+    TABLE = np.eye(MAX_POWER + 1, dtype=float)[:, 1:]
+
+    def __init__(self, cells=16, n=None):
+        super(OneHotEncoder, self).__init__(cells, n)
+        self.cells_view = self.output.reshape(self.output.shape[:-1] + (cells, MAX_POWER))
+
+    def encode(self, exponents):
+        np.take(OneHotEncoder.TABLE, exponents, axis=0, out=self.cells_view)
+        return self.output
+
+
+def get_encoder(name, cells=16, n=None):
+    """
+    Creates an encoder of the specified name.
+    :param name: Name of the encoding ("raw" or "onehot").
+    :param cells: Number of cells of the grid.
+    :param n: Number of boards encoded at once (batch engine), or None for a single board.
+    :return: New instance of encoder.
+    """
+    if name == "raw":
+        return RawEncoder(cells, n)
+    if name == "onehot":
+        return OneHotEncoder(cells, n)
+    raise NotImplementedError
@@ -0,0 +1,162 @@
+"""
+Compact recording of played games of 2048. Games are deterministic given the seed of the game (both engines,
+'game_2048.py' and 'game_2048_bitboard.py', spawn tiles the same way), so a game is fully described by its seed and
+the sequence of moves. Any intermediate board can then be rebuilt by replaying the game, without storing the boards
+or evaluating the model again.
+
+File format (little-endian):
+* header: magic bytes "2048TRJ", version (uint8), rows (uint8), cols (uint8)
+* one record per game: seed (int64), number of moves (uint32), score (int64), moves packed as 2-bit codes (four moves
+  per byte, the first move in the lowest bits), rewards of moves (uint32 each)
+
+Only moves that changed the board are recorded (other moves don't change the game, including its random generator).
+"""
+
+import struct
+import numpy as np
+
+MAGIC = b"2048TRJ"
+VERSION = 1
+HEADER = struct.Struct("<7sBBB")
+RECORD = struct.Struct("<qIq")
+CODE_SHIFTS = np.array([0, 2, 4, 6], dtype=np.uint8)
+
+
+def pack_actions(actions):
+    """
+    Packs moves (directions 0-3) into 2-bit codes.
+    :param actions: Sequence of moves.
+    :return: Packed moves (bytes).
+    """
+    codes = np.zeros(4 * ((len(actions) + 3) // 4), dtype=np.uint8)
+    codes[:len(actions)] = actions
+    return np.bitwise_or.reduce(codes.reshape(-1, 4) << CODE_SHIFTS, axis=1).astype(np.uint8).tobytes()
+
+
+def unpack_actions(data, n):
+    """
+    Inverse of 'pack_actions'.
+    :param data: Packed moves.
+    :param n: Number of moves.
+    :return: Array of moves.
+    """
+    packed = np.frombuffer(data, dtype=np.uint8)
+    return ((packed[:, np.newaxis] >> CODE_SHIFTS) & 3).flatten()[:n]
+
+
+class Trajectory:
+    """
+    Represents a single recorded game.
+    """
+
+    def __init__(self, seed, actions, rewards, score, rows=4, cols=4):
+        self.seed = seed
+        self.actions = actions
+        self.rewards = rewards
+        self.score = score
+        self.rows = rows
+        self.cols = cols
+
+    def __len__(self):
+        return len(self.actions)
+
+    def replay(self, engine, step=None):
+        """
+        Rebuilds the game after the specified number of moves by replaying it. Rewards of the replayed moves are
+        checked against the recorded ones.
+        :param engine: Module of game engine ('game_2048.py' or 'game_2048_bitboard.py').
+        :param step: Number of moves to replay (None for the whole game).
+        :return: Instance of 'Game' of the engine.
+        """
+        game = engine.Game(self.seed, cols=self.cols, rows=self.rows)
+        for i in range(len(self) if step is None else step):
+            moved, reward = game.move(int(self.actions[i]))
+            if not moved or reward != self.rewards[i]:
+                raise ValueError("Trajectory of game with seed {} diverged at move {}.".format(self.seed, i))
+        return game
+
+    def boards(self, engine):
+        """
+        Replays the whole game, yielding the game after every move (the same instance, changed in place).
+        :param engine: Module of game engine ('game_2048.py' or 'game_2048_bitboard.py').
+        """
+        game = engine.Game(self.seed, cols=self.cols, rows=self.rows)
+        yield game
+        for action in self.actions:
+            game.move(int(action))
+            yield game
+
+
+class TrajectoryWriter:
+    """
+    Writes played games into a file, game by game (only the current game is kept in memory).
+    """
+
+    def __init__(self, file_name, rows=4, cols=4):
+        """
+        Creates a new file with trajectories (existing file is overwritten).
+        :param file_name: Name of the file.
+        :param rows: Number of rows of the grid.
+        :param cols: Number of columns of the grid.
+        """
+        self.file = open(file_name, "wb")
+        self.file.write(HEADER.pack(MAGIC, VERSION, rows, cols))
+        self.seed = None
+        self.actions = []
+        self.rewards = []
+
+    def begin(self, seed):
+        """
+        Starts recording of a new game.
+        :param seed: Seed of the game.
+        """
+        self.seed = seed
+        self.actions = []
+        self.rewards = []
+
+    def add(self, action, reward):
+        """
+        Records a move of the current game (only moves that changed the board).
+        :param action: Move (direction).
+        :param reward: Reward of the move.
+        """
+        self.actions.append(action)
+        self.rewards.append(reward)
+
+    def end(self, score):
+        """
+        Finishes the current game and writes it into the file.
+        :param score: Final score of the game.
+        """
+        self.file.write(RECORD.pack(self.seed, len(self.actions), score))
+        self.file.write(pack_actions(self.actions))
+        self.file.write(np.array(self.rewards, dtype="<u4").tobytes())
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def read_trajectories(file_name):
+    """
+    Reads games from the file, one by one.
+    :param file_name: Name of the file (written by 'TrajectoryWriter').
+    :return: Generator of instances of 'Trajectory'.
+    """
+    with open(file_name, "rb") as f:
+        magic, version, rows, cols = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("File '{}' is not a trajectory file of version {}.".format(file_name, VERSION))
+        while True:
+            data = f.read(RECORD.size)
+            if not data:
+                break
+            seed, n, score = RECORD.unpack(data)
+            actions = unpack_actions(f.read((n + 3) // 4), n)
+            rewards = np.frombuffer(f.read(4 * n), dtype="<u4").astype(np.int64)
+            yield Trajectory(seed, actions, rewards, score, rows, cols)